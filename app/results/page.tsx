@@ -275,7 +275,7 @@ export default function ResultsPage() {
               <div className="mt-4">
                 <h3 className="text-lg font-bold">Uploaded Image:</h3>
                 <img
-                  src={`http://localhost/api/uploads/${result.image}`}
+                  src={`http://localhost/api/thumbnails/${result.image}?size=800`}
                   alt={`Uploaded Image ${index + 1}`}
                   className="max-w-[400px] max-h-[400px] border rounded-md shadow-md object-contain"
                   onError={() => handleImageError(index)}
@@ -0,0 +1,260 @@
+import json
+import logging
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from database import get_connection, init_schema, transaction
+from error_table import ErrorTable
+
+logger = logging.getLogger(__name__)
+
+# Scope value aggregating over all classes or all subjects
+ALL = "*"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analytics_pages (
+    upload_id TEXT NOT NULL,
+    page_index INTEGER NOT NULL,
+    user_id TEXT NOT NULL,
+    image TEXT,
+    student_name TEXT NOT NULL,
+    student_class TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    day TEXT NOT NULL,
+    words INTEGER NOT NULL,
+    sentences INTEGER NOT NULL,
+    letters INTEGER NOT NULL,
+    diversity REAL NOT NULL,
+    spelling INTEGER NOT NULL,
+    grammar INTEGER NOT NULL,
+    errors TEXT NOT NULL,
+    PRIMARY KEY (upload_id, page_index)
+);
+CREATE INDEX IF NOT EXISTS idx_analytics_pages_image ON analytics_pages (upload_id, image);
+
+CREATE TABLE IF NOT EXISTS analytics_totals (
+    user_id TEXT NOT NULL,
+    student_class TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    sentences INTEGER NOT NULL,
+    letters INTEGER NOT NULL,
+    diversity REAL NOT NULL,
+    spelling INTEGER NOT NULL,
+    grammar INTEGER NOT NULL,
+    PRIMARY KEY (user_id, student_class, subject)
+);
+
+CREATE TABLE IF NOT EXISTS analytics_pairs (
+    user_id TEXT NOT NULL,
+    student_class TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    incorrect TEXT NOT NULL,
+    correct TEXT NOT NULL,
+    category TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (user_id, student_class, subject, incorrect, correct, category)
+);
+CREATE INDEX IF NOT EXISTS idx_analytics_pairs_top ON analytics_pairs (user_id, student_class, subject, count DESC);
+
+CREATE TABLE IF NOT EXISTS analytics_students (
+    user_id TEXT NOT NULL,
+    student_class TEXT NOT NULL,
+    subject TEXT NOT NULL,
+    student_name TEXT NOT NULL,
+    day TEXT NOT NULL,
+    pages INTEGER NOT NULL,
+    words INTEGER NOT NULL,
+    spelling INTEGER NOT NULL,
+    grammar INTEGER NOT NULL,
+    PRIMARY KEY (user_id, student_class, subject, student_name, day)
+);
+"""
+
+_COUNTERS = ("words", "sentences", "letters", "diversity", "spelling", "grammar")
+
+
+def _scopes(student_class, subject):
+    """Every aggregate a page counts towards: its class and subject, and the roll-ups over either"""
+    return list(dict.fromkeys([
+        (student_class, subject), (student_class, ALL), (ALL, subject), (ALL, ALL),
+    ]))
+
+
+def _per_100_words(count, words):
+    return round(100 * count / words, 2) if words else 0.0
+
+
+class ClassAnalytics:
+    """Error and writing statistics per class and subject, kept up to date as pages are graded.
+
+    Each stored page keeps its own contribution, so a retried page is subtracted
+    and re-added instead of re-scanning the upload history. complexity(text)
+    returns text_improvement.text_metrics-style metrics (word_count,
+    sentence_count, avg_word_length, vocabulary_diversity); it must not detect
+    the language, which would cost an LLM call per page.
+    """
+
+    def __init__(self, complexity, db_path=None):
+        self.complexity = complexity
+        self.db_path = db_path
+        init_schema(SCHEMA, db_path)
+
+    def _contribution(self, result):
+        """Counters of one graded page, or None for pages that failed"""
+        if not isinstance(result, dict) or "error" in result or "extractedText" not in result:
+            return None
+        metrics = self.complexity(result.get("extractedText") or "")
+        entries = ErrorTable.from_records(result.get("errorTable") or [])
+        pairs = Counter((entry.incorrect, entry.correct, entry.category) for entry in entries)
+        return {
+            "words": metrics["word_count"],
+            "sentences": metrics["sentence_count"],
+            "letters": round(metrics["avg_word_length"] * metrics["word_count"]),
+            "diversity": metrics["vocabulary_diversity"] / 100,
+            "spelling": sum(1 for entry in entries if entry.category == "Spelling"),
+            "grammar": sum(1 for entry in entries if entry.category != "Spelling"),
+            "errors": [[*pair, count] for pair, count in pairs.items()],
+        }
+
+    def record_upload(self, user_id, upload_id, results, student_name=None, student_class=None, subject=None):
+        """Add the pages of a saved upload (replacing them if the upload id was recorded before)"""
+        contributions = [(index, result, self._contribution(result)) for index, result in enumerate(results)]
+        day = datetime.now(timezone.utc).date().isoformat()
+        with transaction(self.db_path) as conn:
+            for page in conn.execute("SELECT * FROM analytics_pages WHERE upload_id = ?", (upload_id,)).fetchall():
+                self._apply(conn, page, -1)
+            conn.execute("DELETE FROM analytics_pages WHERE upload_id = ?", (upload_id,))
+            for index, result, contribution in contributions:
+                if contribution is None:
+                    continue
+                page = dict(
+                    contribution, upload_id=upload_id, page_index=index, user_id=str(user_id),
+                    image=result.get("image"), student_name=student_name or "", student_class=student_class or "",
+                    subject=subject or "", day=day, errors=json.dumps(contribution["errors"]),
+                )
+                self._insert_page(conn, page)
+                self._apply(conn, page, 1)
+
+    def record_page(self, upload_id, image, result):
+        """Replace the contribution of a retried page (first page of upload_id showing image)"""
+        contribution = self._contribution(result)
+        with transaction(self.db_path) as conn:
+            page = conn.execute(
+                "SELECT * FROM analytics_pages WHERE upload_id = ? AND image = ? ORDER BY page_index LIMIT 1",
+                (upload_id, image),
+            ).fetchone()
+            if page is None:
+                logger.debug("No analytics for page %s of upload %s", image, upload_id)
+                return
+            self._apply(conn, page, -1)
+            conn.execute("DELETE FROM analytics_pages WHERE upload_id = ? AND page_index = ?",
+                         (upload_id, page["page_index"]))
+            if contribution is not None:
+                updated = dict(page, **contribution)
+                updated["errors"] = json.dumps(contribution["errors"])
+                self._insert_page(conn, updated)
+                self._apply(conn, updated, 1)
+
+    def _insert_page(self, conn, page):
+        columns = ("upload_id", "page_index", "user_id", "image", "student_name", "student_class", "subject",
+                   "day") + _COUNTERS + ("errors",)
+        conn.execute(
+            f"INSERT INTO analytics_pages ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+            [page[column] for column in columns],
+        )
+
+    def _apply(self, conn, page, sign):
+        """Add (sign=1) or remove (sign=-1) one page's counters from every aggregate it belongs to"""
+        counters = [sign * page[column] for column in _COUNTERS]
+        errors = json.loads(page["errors"])
+        for student_class, subject in _scopes(page["student_class"], page["subject"]):
+            key = (page["user_id"], student_class, subject)
+            conn.execute(
+                "INSERT INTO analytics_totals (user_id, student_class, subject, pages, words, sentences, letters,"
+                " diversity, spelling, grammar) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (user_id, student_class, subject) DO UPDATE SET pages = pages + excluded.pages,"
+                " words = words + excluded.words, sentences = sentences + excluded.sentences,"
+                " letters = letters + excluded.letters, diversity = diversity + excluded.diversity,"
+                " spelling = spelling + excluded.spelling, grammar = grammar + excluded.grammar",
+                (*key, sign, *counters),
+            )
+            conn.execute(
+                "INSERT INTO analytics_students (user_id, student_class, subject, student_name, day, pages, words,"
+                " spelling, grammar) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (user_id, student_class, subject, student_name, day) DO UPDATE SET"
+                " pages = pages + excluded.pages, words = words + excluded.words,"
+                " spelling = spelling + excluded.spelling, grammar = grammar + excluded.grammar",
+                (*key, page["student_name"], page["day"], sign, sign * page["words"],
+                 sign * page["spelling"], sign * page["grammar"]),
+            )
+            conn.executemany(
+                "INSERT INTO analytics_pairs (user_id, student_class, subject, incorrect, correct, category, count)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)"
+                " ON CONFLICT (user_id, student_class, subject, incorrect, correct, category)"
+                " DO UPDATE SET count = count + excluded.count",
+                [(*key, incorrect, correct, category, sign * count) for incorrect, correct, category, count in errors],
+            )
+            if sign < 0:
+                for table, column in (("analytics_pairs", "count"), ("analytics_students", "pages"),
+                                      ("analytics_totals", "pages")):
+                    conn.execute(f"DELETE FROM {table} WHERE user_id = ? AND student_class = ? AND subject = ?"
+                                 f" AND {column} <= 0", key)
+
+    def summary(self, user_id, student_class=ALL, subject=ALL, top=10):
+        """Precomputed statistics of one class/subject scope (ALL for every class or subject)"""
+        conn = get_connection(self.db_path)
+        key = (str(user_id), student_class, subject)
+        totals = conn.execute(
+            "SELECT * FROM analytics_totals WHERE user_id = ? AND student_class = ? AND subject = ?", key
+        ).fetchone()
+        pairs = conn.execute(
+            "SELECT incorrect, correct, category, count FROM analytics_pairs"
+            " WHERE user_id = ? AND student_class = ? AND subject = ? ORDER BY count DESC LIMIT ?",
+            (*key, top),
+        ).fetchall()
+        rows = conn.execute(
+            "SELECT student_name, day, pages, words, spelling, grammar FROM analytics_students"
+            " WHERE user_id = ? AND student_class = ? AND subject = ? ORDER BY student_name, day",
+            key,
+        ).fetchall()
+
+        students = {}
+        for row in rows:
+            student = students.setdefault(row["student_name"], {
+                "studentName": row["student_name"], "pages": 0, "words": 0, "spelling": 0, "grammar": 0, "trend": [],
+            })
+            for column in ("pages", "words", "spelling", "grammar"):
+                student[column] += row[column]
+            student["trend"].append({
+                "day": row["day"],
+                "pages": row["pages"],
+                "words": row["words"],
+                "errorsPer100Words": _per_100_words(row["spelling"] + row["grammar"], row["words"]),
+            })
+        for student in students.values():
+            student["errorsPer100Words"] = _per_100_words(student["spelling"] + student["grammar"], student["words"])
+
+        pages = totals["pages"] if totals else 0
+        words = totals["words"] if totals else 0
+        return {
+            "studentClass": student_class,
+            "subject": subject,
+            "pages": pages,
+            "words": words,
+            "categories": {
+                "Spelling": totals["spelling"] if totals else 0,
+                "Grammar": totals["grammar"] if totals else 0,
+            },
+            "errorsPer100Words": _per_100_words((totals["spelling"] + totals["grammar"]) if totals else 0, words),
+            "complexity": {
+                "avgWordsPerSentence": round(words / totals["sentences"], 1) if totals and totals["sentences"] else 0,
+                "avgWordLength": round(totals["letters"] / words, 1) if words else 0,
+                "vocabularyDiversity": round(100 * totals["diversity"] / pages, 1) if pages else 0,
+            },
+            "topErrors": [dict(pair) for pair in pairs],
+            "students": list(students.values()),
+            "generatedAt": time.time(),
+        }
@@ -1,24 +1,39 @@
 # backend/app.py
 
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, g, request, jsonify
 from flask_cors import CORS
 import os
-import uuid
-import pandas as pd
-from backend_handwriting import extract_text_from_image, correct_spelling_grammar, mark_text, create_pdf, pdf_to_word
-from fpdf import FPDF
-import re
-from PIL import Image
-from text_improvement import get_text_improvements, analyze_text_complexity, generate_improvement_suggestions
-import json, time, pdfkit
+import multiprocessing
+import threading
+from backend_handwriting import create_pdf, ocr_cache
+from grading import grade_image, grade_page, grade_pages, iter_graded_pages
+from jobs import JobQueue
+from result_store import create_result_store
+from analytics import ALL, ClassAnalytics
+from error_table import ErrorTable
+from pdf_reports import cached_report, write_improvements_pdf
+from report_templates import load_templates
+from lazy_imports import preload
+from thumbnails import RENDITION_DIR, get_rendition, prewarm_rendition, thumbnail_size
+from static_files import send_stored_file
+from batch_reports import iter_reports_zip
+from storage import BlobStore, RetentionCollector
+from observability import (HTTP_IN_FLIGHT, HTTP_REQUEST_SECONDS, METRICS_TOKEN, REGISTRY,
+                           configure_logging, stage)
+from text_improvement import agenerate_improvement_suggestions, detect_language, text_metrics
+import json, time
 
 ## JWT: Import new libraries for JWT, password hashing, and decorators
 import jwt
 from datetime import datetime, timedelta, timezone
 from functools import wraps
-from werkzeug.security import generate_password_hash, check_password_hash
+import asyncio
+import inspect
+from werkzeug.security import check_password_hash, safe_join
 
 
+configure_logging()
+
 app = Flask(__name__)
 CORS(app)
 
@@ -29,8 +44,8 @@ app.config['SECRET_KEY'] = 'a-very-secret-and-long-random-string-that-no-one-can
 
 # Ensure absolute path for uploads
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-PDF_DIRECTORY = os.path.join(BASE_DIR, "generated_pdfs")
-UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
+PDF_DIRECTORY = os.environ.get("PDF_DIRECTORY", os.path.join(BASE_DIR, "generated_pdfs"))
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", os.path.join(BASE_DIR, "uploads"))
 PDF_WORD_DIRECTORY = os.path.join(BASE_DIR, "documents")
 
 # Create directories if they don't exist
@@ -41,14 +56,84 @@ os.makedirs(PDF_WORD_DIRECTORY, exist_ok=True)
 ## JWT: Simple in-memory user store for demonstration.
 ## In a real app, this would be a database (like PostgreSQL or MongoDB).
 ## The password 'testpassword' is hashed for security.
+## The hash is precomputed: pbkdf2 with a million iterations costs over half a second per startup.
 users = {
     "teacher@example.com": {
-        "password": generate_password_hash("testpassword", method='pbkdf2:sha256'),
+        "password": "pbkdf2:sha256:1000000$ZoljwEOM1K0YwVHw$b1edb3f22d47574deef67b7d8359f495c9974ed01cbbcdff06dfd161f7e5a88b",
         "id": "1"
     }
 }
 
-stored_results = []
+# Per-user grading history (SQLite by default, see RESULT_STORE)
+result_store = create_result_store()
+# Uploaded images, stored once per content hash under sharded paths in UPLOAD_FOLDER
+blob_store = BlobStore(UPLOAD_FOLDER)
+# Per-class error and writing statistics, updated as uploads and retries are stored
+class_analytics = ClassAnalytics(text_metrics)
+
+
+def store_job_results(job):
+    """Save a finished async job into the result store under the job id"""
+    results = [page['result'] for page in job['pages'] if page['result']]
+    if results:
+        result_store.save_upload(job['userId'], results, job['studentName'], job['studentClass'],
+                                 job['subject'], upload_id=job['jobId'])
+        class_analytics.record_upload(job['userId'], job['jobId'], results, job['studentName'],
+                                      job['studentClass'], job['subject'])
+
+
+# Background grading queue used by `/upload` when the client asks for async processing
+job_queue = JobQueue(grade_page, on_complete=store_job_results)
+# Expires unused uploads and old generated PDFs/documents (see the *_RETENTION_DAYS settings)
+retention_collector = RetentionCollector(blob_store, PDF_DIRECTORY, PDF_WORD_DIRECTORY,
+                                         protected=job_queue.active_images)
+# Heavy modules (openai, cv2, fpdf, ...) are imported on first use. "background" loads them in a
+# thread once the server runs, "eager" before it serves (e.g. in the parent of a forking server)
+APP_PRELOAD = os.environ.get("APP_PRELOAD", "background").lower()
+
+
+def warm_up():
+    preload(load_templates)
+
+
+# Spawned worker processes (the batch report pool) re-import this module; only the server runs the queue
+if multiprocessing.parent_process() is None:
+    job_queue.start()
+    retention_collector.start()
+    if APP_PRELOAD == "background":
+        threading.Thread(target=warm_up, name="preload", daemon=True).start()
+if APP_PRELOAD == "eager":
+    warm_up()
+
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    g.metrics_endpoint = request.endpoint or 'unmatched'
+    HTTP_IN_FLIGHT.inc(endpoint=g.metrics_endpoint)
+
+
+@app.after_request
+def record_request_metrics(response):
+    if 'metrics_started' in g:
+        HTTP_REQUEST_SECONDS.observe(time.perf_counter() - g.metrics_started, endpoint=g.metrics_endpoint,
+                                     method=request.method, status=response.status_code)
+    return response
+
+
+@app.teardown_request
+def finish_request_metrics(error=None):
+    endpoint = g.pop('metrics_endpoint', None)
+    if endpoint is not None:
+        HTTP_IN_FLIGHT.dec(endpoint=endpoint)
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus scrape endpoint: stage timings, LLM calls and tokens, cache lookups, in-flight requests"""
+    if METRICS_TOKEN and request.headers.get('Authorization') != f'Bearer {METRICS_TOKEN}':
+        return jsonify({'message': 'Token is invalid!'}), 401
+    return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
 
 
 ## JWT: Create the decorator to protect routes.
@@ -80,6 +165,13 @@ def token_required(f):
         # Pass the current user to the decorated function
         return f(current_user, *args, **kwargs)
 
+    # Async views stay coroutines so Flask awaits them (an auth error is returned as is)
+    if inspect.iscoroutinefunction(f):
+        @wraps(f)
+        async def decorated_async(*args, **kwargs):
+            result = decorated(*args, **kwargs)
+            return await result if inspect.isawaitable(result) else result
+        return decorated_async
     return decorated
 
 
@@ -112,23 +204,56 @@ def login():
 @app.route('/download_pdf/<filename>', methods=['GET'])
 def download_pdf(filename):
     # This route might not need protection if PDFs are meant to be public links
-    file_path = os.path.join(PDF_DIRECTORY, filename)
-    if not os.path.exists(file_path):
-        return jsonify({'error': 'File not found'}), 404
-    return send_from_directory(PDF_DIRECTORY, filename, as_attachment=False)
+    return send_stored_file(PDF_DIRECTORY, 'generated_pdfs', filename)
 
 @app.route('/uploads/<path:filename>', methods=['GET'])
 def serve_image(filename):
     # This route should also be protected to prevent unauthorized image access
-    return send_from_directory(UPLOAD_FOLDER, filename)
+    return send_stored_file(UPLOAD_FOLDER, 'uploads', filename)
+
+
+@app.route('/thumbnails/<path:filename>', methods=['GET'])
+def serve_thumbnail(filename):
+    """Downscaled JPEG of an upload (?size=long edge in px), created once and cached on disk"""
+    image_path = safe_join(UPLOAD_FOLDER, filename)
+    if image_path is None or not os.path.isfile(image_path):
+        return jsonify({'error': 'File not found'}), 404
+    try:
+        size = thumbnail_size(int(request.args.get('size', 400)))
+        rendition = get_rendition(image_path, max_edge=size)
+    except ValueError:
+        return jsonify({'error': 'Invalid size'}), 400
+    except Exception:
+        return jsonify({'error': 'Image could not be decoded'}), 415
+    return send_stored_file(RENDITION_DIR, 'renditions', os.path.relpath(rendition, RENDITION_DIR))
+
+
+def save_uploaded_files(files, owner_id=None):
+    """Store uploaded images by content hash; returns (filepath, image name) pairs"""
+    saved_pages = []
+    for file in files:
+        with stage("file_save"):
+            image_name = blob_store.save(file.stream, file.filename, owner_id=owner_id)
+        filepath = blob_store.path(image_name)
+        prewarm_rendition(filepath)
+        saved_pages.append((filepath, image_name))
+    return saved_pages
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+def sse_response(events):
+    # X-Accel-Buffering stops nginx-style proxies from holding events back
+    return Response(events, mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 ## JWT: Add the @token_required decorator to all routes that need protection.
 @app.route('/upload', methods=['POST'])
 @token_required
 def upload_files(current_user):
-    global stored_results
-    stored_results = []
     # (The rest of your upload logic remains the same)
     student_name = request.form.get('studentName')
     student_class = request.form.get('studentClass')
@@ -138,47 +263,103 @@ def upload_files(current_user):
     if not files:
         return jsonify({'error': 'No images uploaded'}), 400
 
-    extracted_text_list = []
-    for file in files:
-        file_ext = os.path.splitext(file.filename)[1]
-        unique_filename = f"{uuid.uuid4()}{file_ext}"
-        filepath = os.path.join(UPLOAD_FOLDER, unique_filename)
-        file.save(filepath)
-        extracted_text = extract_text_from_image(filepath)
-        extracted_text_list.append({'image': unique_filename, 'text': extracted_text})
-
-    final_results = []
-    for item in extracted_text_list:
-        extracted_text = item['text']
-        errors = correct_spelling_grammar(extracted_text)
-        if isinstance(errors, str):
-            errors = [line.split("->") for line in errors.splitlines() if "->" in line and len(line.split("->")) == 3]
-        if isinstance(errors, list) and len(errors) > 0 and all(isinstance(entry, list) and len(entry) == 3 for entry in errors):
-            for entry in errors:
-                entry[0] = re.sub(r'^\d+\.\s*', '', entry[0])
-                entry[2] = 'Spelling' if 'spell' in entry[2].lower() else 'Grammar'
-            df = pd.DataFrame(errors, columns=["Incorrect Text", "Correct Text", "Error Category"])
-        else:
-            df = pd.DataFrame(columns=["Incorrect Text", "Correct Text", "Error Category"])
-        marked_text = mark_text(extracted_text, df)
-        result = {
-            'image': item['image'],
-            'extractedText': extracted_text,
-            'errorTable': df.to_dict(orient='records'),
-            'markedText': marked_text
-        }
-        final_results.append(result)
+    saved_pages = save_uploaded_files(files, owner_id=current_user['id'])
+
+    # Async mode: hand the saved pages to the background workers and return right away
+    if str(request.values.get('async', '')).lower() in ('1', 'true', 'yes'):
+        job_id = job_queue.enqueue(current_user['id'], saved_pages, student_name, student_class, subject)
+        return jsonify({'jobId': job_id, 'status': 'queued', 'statusUrl': f'/jobs/{job_id}'}), 202
+
+    # Each page runs OCR -> grammar -> marking independently; results keep upload order
+    final_results = grade_pages(saved_pages)
     
-    stored_results = final_results
-    return jsonify({'studentName': student_name, 'studentClass': student_class, 'subject': subject, 'results': final_results})
+    upload_id = result_store.save_upload(current_user['id'], final_results, student_name, student_class, subject)
+    class_analytics.record_upload(current_user['id'], upload_id, final_results, student_name, student_class, subject)
+    return jsonify({'uploadId': upload_id, 'studentName': student_name, 'studentClass': student_class, 'subject': subject, 'results': final_results})
+
+@app.route('/upload/stream', methods=['POST'])
+@token_required
+def upload_files_stream(current_user):
+    """Like /upload, but streams Server-Sent Events as each page's OCR text and result are ready"""
+    student_name = request.form.get('studentName')
+    student_class = request.form.get('studentClass')
+    subject = request.form.get('subject')
+    files = request.files.getlist('images')
+
+    if not files:
+        return jsonify({'error': 'No images uploaded'}), 400
+
+    saved_pages = save_uploaded_files(files, owner_id=current_user['id'])
+
+    def generate():
+        yield sse_event('start', {'totalPages': len(saved_pages), 'images': [name for _, name in saved_pages]})
+        final_results = [None] * len(saved_pages)
+        for event, index, data in iter_graded_pages(saved_pages):
+            if event != 'ocr':
+                final_results[index] = data
+            yield sse_event(event, dict(data, index=index))
+        graded = [r for r in final_results if 'error' not in r]
+        # Nothing to keep if every page failed; an empty upload would shadow the last real one in /get_results
+        upload_id = None
+        if graded:
+            upload_id = result_store.save_upload(current_user['id'], graded, student_name, student_class, subject)
+            class_analytics.record_upload(current_user['id'], upload_id, graded, student_name, student_class,
+                                          subject)
+        yield sse_event('done', {'uploadId': upload_id, 'studentName': student_name, 'studentClass': student_class,
+                                 'subject': subject, 'results': final_results})
+
+    return sse_response(generate())
 
 @app.route('/get_results', methods=['GET'])
 @token_required
 def get_results(current_user):
-    global stored_results
-    if not stored_results:
-        return jsonify({'error': 'No results found'}), 404
-    return jsonify({'results': stored_results})
+    args = request.args
+    upload_id = args.get('uploadId')
+    history_params = ('page', 'pageSize', 'studentName', 'studentClass', 'subject')
+    if upload_id or not any(name in args for name in history_params):
+        # Single upload: the requested one, or the user's latest (the original response shape)
+        upload = result_store.get_upload(current_user['id'], upload_id) if upload_id else result_store.latest_upload(current_user['id'])
+        if not upload or not upload['results']:
+            return jsonify({'error': 'No results found'}), 404
+        return jsonify(upload)
+
+    page = max(args.get('page', 1, type=int), 1)
+    page_size = min(max(args.get('pageSize', 20, type=int), 1), 100)
+    include_results = args.get('includeResults', '').lower() in ('1', 'true', 'yes')
+    uploads, total = result_store.list_uploads(
+        current_user['id'],
+        student_name=args.get('studentName'),
+        student_class=args.get('studentClass'),
+        subject=args.get('subject'),
+        limit=page_size,
+        offset=(page - 1) * page_size,
+        include_results=include_results,
+    )
+    return jsonify({'uploads': uploads, 'page': page, 'pageSize': page_size, 'total': total})
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+@token_required
+def job_status(current_user, job_id):
+    job = job_queue.get(job_id, current_user['id'])
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    # Progress view: page results are only returned by /jobs/<id>/results
+    for page in job['pages']:
+        page.pop('result')
+    return jsonify(job)
+
+@app.route('/jobs/<job_id>/results', methods=['GET'])
+@token_required
+def job_results(current_user, job_id):
+    job = job_queue.get(job_id, current_user['id'])
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+    if job['status'] not in ('completed', 'failed'):
+        return jsonify({'error': 'Job not finished', 'status': job['status'],
+                        'donePages': job['donePages'], 'totalPages': job['totalPages']}), 409
+    results = [page['result'] or {'image': page['image'], 'error': page['error']} for page in job['pages']]
+    return jsonify({'studentName': job['studentName'], 'studentClass': job['studentClass'],
+                    'subject': job['subject'], 'status': job['status'], 'results': results})
 
 @app.route('/retry_image', methods=['POST'])
 @token_required
@@ -191,25 +372,83 @@ def retry_image(current_user):
     full_path = os.path.join(UPLOAD_FOLDER, image_filename)
     if not os.path.exists(full_path):
         return jsonify({'error': 'File not found on server'}), 404
-    extracted_text = extract_text_from_image(full_path)
-    errors = correct_spelling_grammar(extracted_text)
-    if isinstance(errors, str):
-        errors = [line.split("->") for line in errors.splitlines() if "->" in line and len(line.split("->")) == 3]
-    if (isinstance(errors, list) and len(errors) > 0 and all(isinstance(entry, list) and len(entry) == 3 for entry in errors)):
-        for entry in errors:
-            entry[0] = re.sub(r'^\d+\.\s*', '', entry[0])
-            entry[2] = 'Spelling' if 'spell' in entry[2].lower() else 'Grammar'
-        df = pd.DataFrame(errors, columns=["Incorrect Text", "Correct Text", "Error Category"])
-    else:
-        df = pd.DataFrame(columns=["Incorrect Text", "Correct Text", "Error Category"])
-    marked_text = mark_text(extracted_text, df)
-    updated_result = {
-        "extractedText": extracted_text,
-        "errorTable": df.to_dict(orient="records"),
-        "markedText": marked_text
-    }
+    blob_store.touch(image_filename)
+    # A retry exists to get a fresh transcription, so the OCR cache is bypassed unless asked for
+    use_cache = bool(data.get('useCache', False))
+    updated_result = grade_image(full_path, use_cache=use_cache)
+    upload_id = result_store.update_page(current_user['id'], image_filename, updated_result, upload_id=data.get('uploadId'))
+    if upload_id:
+        class_analytics.record_page(upload_id, image_filename, updated_result)
     return jsonify(updated_result)
 
+@app.route('/retry_image/stream', methods=['POST'])
+@token_required
+def retry_image_stream(current_user):
+    """Like /retry_image, but streams the OCR text before the grammar check finishes"""
+    data = request.get_json()
+    if not data or 'image' not in data:
+        return jsonify({'error': 'No image provided'}), 400
+    image_filename = data['image']
+    full_path = os.path.join(UPLOAD_FOLDER, image_filename)
+    if not os.path.exists(full_path):
+        return jsonify({'error': 'File not found on server'}), 404
+    blob_store.touch(image_filename)
+    use_cache = bool(data.get('useCache', False))
+    upload_id = data.get('uploadId')
+
+    def generate():
+        for event, _, result in iter_graded_pages([(full_path, image_filename)], use_cache=use_cache):
+            if event == 'page':
+                stored_upload_id = result_store.update_page(current_user['id'], image_filename, result, upload_id=upload_id)
+                if stored_upload_id:
+                    class_analytics.record_page(stored_upload_id, image_filename, result)
+            yield sse_event(event, result)
+        yield sse_event('done', {'image': image_filename})
+
+    return sse_response(generate())
+
+@app.route('/analytics/class', methods=['GET'])
+@token_required
+def class_analytics_summary(current_user):
+    """Most common errors, category counts, writing metrics and per-student trends of a class and subject.
+
+    Omitting studentClass or subject aggregates over all of them; the numbers are
+    maintained as pages are graded, so this reads a handful of precomputed rows.
+    """
+    args = request.args
+    top = min(max(args.get('top', 10, type=int), 1), 100)
+    return jsonify(class_analytics.summary(current_user['id'], args.get('studentClass') or ALL,
+                                           args.get('subject') or ALL, top=top))
+
+@app.route('/ocr_cache/stats', methods=['GET'])
+@token_required
+def ocr_cache_stats(current_user):
+    return jsonify(ocr_cache.stats())
+
+def prepare_report_results(results):
+    """Resolve page results sent by the client into the form create_pdf expects"""
+    processed_results = []
+    for result in results:
+        error_table = ErrorTable.from_records(result.get('errorTable', []))
+        full_image_path = ''
+        image_path = result.get('image', '')
+        if image_path:
+            full_image_path = os.path.join(UPLOAD_FOLDER, image_path)
+            if not os.path.exists(full_image_path): continue
+            blob_store.touch(image_path)
+            # Reports embed a cached, report-sized rendition; images that cannot be decoded are skipped
+            try:
+                full_image_path = get_rendition(full_image_path)
+            except Exception as e: continue
+        processed_results.append({
+            'image': full_image_path,
+            'extractedText': result.get('extractedText', 'No extracted text'),
+            'errorTable': error_table.to_records(),
+            'errorSpans': result.get('errorSpans'),
+            'markedText': result.get('markedText', 'No marked text')
+        })
+    return processed_results
+
 @app.route('/generate_pdf', methods=['POST'])
 @token_required
 def generate_pdf(current_user):
@@ -222,27 +461,8 @@ def generate_pdf(current_user):
     subject = data.get('subject', 'Unknown')
     if 'results' not in data or len(data['results']) == 0:
         return jsonify({'error': 'No extracted text provided'}), 400
-    processed_results = []
     try:
-        for result in data['results']:
-            error_table_data = result.get('errorTable', [])
-            if isinstance(error_table_data, list) and len(error_table_data) > 0:
-                error_df = pd.DataFrame(error_table_data)
-            else:
-                error_df = pd.DataFrame(columns=["Incorrect Text", "Correct Text", "Error Category"])
-            image_path = result.get('image', '')
-            if image_path:
-                full_image_path = os.path.join(UPLOAD_FOLDER, image_path)
-                if not os.path.exists(full_image_path): continue
-                try:
-                    with Image.open(full_image_path) as img: img.verify()
-                except Exception as e: continue
-            processed_results.append({
-                'image': full_image_path,
-                'extractedText': result.get('extractedText', 'No extracted text'),
-                'errorTable': error_df.to_dict(orient='records'),
-                'markedText': result.get('markedText', 'No marked text')
-            })
+        processed_results = prepare_report_results(data['results'])
         if not processed_results:
             return jsonify({'error': 'No valid results to generate PDF'}), 400
         pdf_file_path = create_pdf(student_name, student_class, subject, processed_results)
@@ -250,19 +470,55 @@ def generate_pdf(current_user):
     except Exception as e:
         return jsonify({'error': 'Failed to generate PDF', 'message': str(e)}), 500
 
+@app.route('/generate_pdf_batch', methods=['POST'])
+@token_required
+def generate_pdf_batch(current_user):
+    """Reports for many students at once, rendered in a process pool and streamed back as a ZIP.
+
+    Body: {"students": [{studentName, studentClass, subject, results}, ...]} and/or
+    {"uploadIds": [...]} to use stored uploads. Per-student failures are listed in
+    the archive's manifest.json.
+    """
+    data = request.get_json()
+    if not data or not (data.get('students') or data.get('uploadIds')):
+        return jsonify({'error': 'No students provided'}), 400
+
+    entries = list(data.get('students') or [])
+    for upload_id in data.get('uploadIds') or []:
+        upload = result_store.get_upload(current_user['id'], upload_id)
+        entries.append(upload or {'studentName': upload_id, 'error': 'Upload not found'})
+
+    students = []
+    for entry in entries:
+        student = {key: entry.get(key, 'Unknown') for key in ('studentName', 'studentClass', 'subject')}
+        if entry.get('error'):
+            student['error'] = entry['error']
+        else:
+            try:
+                student['results'] = prepare_report_results(entry.get('results') or [])
+            except Exception as e:
+                student['error'] = str(e)
+            if not student.get('error') and not student['results']:
+                student['error'] = 'No valid results to generate PDF'
+        students.append(student)
+
+    filename = f"reports_{int(time.time())}.zip"
+    return Response(iter_reports_zip(students), mimetype='application/zip',
+                    headers={'Content-Disposition': f'attachment; filename="{filename}"'})
+
 @app.route('/get_improvements', methods=['POST'])
 @token_required
-def get_improvements(current_user):
-    # (The rest of your improvements logic remains the same)
+async def get_improvements(current_user):
+    """Complexity metrics and LLM suggestions; the LLM call is awaited on the shared async client"""
     data = request.get_json()
     if not data or 'text' not in data: return jsonify({'error': 'No text provided'}), 400
     text = data['text']
     try:
-        complexity_metrics = analyze_text_complexity(text)
-        try:
-            suggestions_json = generate_improvement_suggestions(text)
-        except Exception as e:
-            suggestions_json = json.dumps({"style_improvements": ["Error generating style suggestions"],"vocabulary_enhancements": [],"structure_suggestions": ["Error generating structure suggestions"],"strengths": ["Text analysis unavailable"]})
+        # Detected once for both parts: two concurrent misses of the language memo would
+        # each fall back to the LLM when the offline detector is unsure
+        language = await asyncio.to_thread(detect_language, text)
+        complexity_metrics = {"language": language, **text_metrics(text)}
+        suggestions_json = await agenerate_improvement_suggestions(text, language)
         improvements = {"complexity_metrics": complexity_metrics, "improvement_suggestions": suggestions_json}
         return jsonify({'text': text, 'improvements': improvements})
     except Exception as e:
@@ -281,40 +537,15 @@ def improvements_pdf(current_user):
     try:
         suggestions = raw_sugg if isinstance(raw_sugg, dict) else json.loads(raw_sugg)
     except Exception as e: suggestions = {}
-    html = "<html><body style='font-family:Arial;'>"
-    html += "<h1>Text Improvement Report</h1>"
-    html += "<h2>Original Text</h2>"
-    html += f"<p>{text.replace(chr(10), '<br>')}</p>"
-    html += "<h2>Complexity Metrics</h2><ul>"
-    html += f"<li>Word Count: {metrics.get('word_count','–')}</li>"
-    html += f"<li>Sentence Count: {metrics.get('sentence_count','–')}</li>"
-    html += f"<li>Avg. Words / Sentence: {metrics.get('avg_words_per_sentence','–')}</li>"
-    html += f"<li>Avg. Word Length: {metrics.get('avg_word_length','–')}</li>"
-    html += f"<li>Vocabulary Diversity: {metrics.get('vocabulary_diversity','–')}%</li>"
-    html += "</ul>"
-    def build_list(title: str, items):
-        out = f"<h2>{title}</h2><ul>"
-        for itm in items: out += f"<li>{itm}</li>"
-        out += "</ul>"
-        return out
-    html += build_list("Strengths", suggestions.get("strengths", []))
-    html += build_list("Style Improvements", suggestions.get("style_improvements", []))
-    vocab = suggestions.get("vocabulary_enhancements", [])
-    html += "<h2>Vocabulary Enhancements</h2><ul>"
-    for entry in vocab:
-        original = entry.get("original", "")
-        alternatives = ", ".join(entry.get("suggestions", []))
-        html += f"<li><b>{original}</b> → {alternatives}</li>"
-    html += "</ul>"
-    html += build_list("Structure Suggestions", suggestions.get("structure_suggestions", []))
-    html += "</body></html>"
-    ts = int(time.time())
-    filename = f"improvement_{ts}.pdf"
-    pdf_path = os.path.join(PDF_DIRECTORY, filename)
+    inputs = {"text": "\n".join(line.rstrip() for line in str(text).strip().splitlines()),
+              "metrics": metrics, "suggestions": suggestions}
     try:
-        pdfkit.from_string(html, pdf_path, options={"enable-local-file-access": ""})
+        with stage("pdf_render"):
+            # Identical reports are rendered once; the content-hash name also keeps concurrent requests apart
+            filename = cached_report(PDF_DIRECTORY, "improvement", inputs, lambda pdf_path: write_improvements_pdf(
+                pdf_path, inputs["text"], metrics, suggestions))
     except Exception as e: return jsonify({"error": "Failed to create PDF"}), 500
-    return jsonify({"pdfPath": os.path.basename(filename)})
+    return jsonify({"pdfPath": filename})
 
 if __name__ == '__main__':
     ## JWT: Run the app on a different port if you want, e.g., 5001
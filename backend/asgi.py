@@ -0,0 +1,34 @@
+"""Production entry point: the Flask app served by uvicorn through an ASGI adapter.
+
+    python asgi.py                          # listens on $HOST:$PORT (default 0.0.0.0:5000)
+    uvicorn asgi:application --port 5000    # equivalent, single process
+
+Synchronous views run on a pool of ASGI_THREADS threads, so one worker keeps that
+many requests (mostly waiting on the LLM) in flight. Async views such as
+/get_improvements await achat_completion on the shared AsyncOpenAI client.
+Run one process per container: the job queue and storage collector start only in
+the process that is not a multiprocessing child (see app.py).
+"""
+import os
+
+from a2wsgi import WSGIMiddleware
+
+from app import app
+
+HOST = os.environ.get("HOST", "0.0.0.0")
+PORT = int(os.environ.get("PORT", "5000"))
+# Requests handled at once per process
+ASGI_THREADS = int(os.environ.get("ASGI_THREADS", "64"))
+
+application = WSGIMiddleware(app, workers=ASGI_THREADS)
+
+
+def main():
+    import uvicorn
+
+    uvicorn.run(application, host=HOST, port=PORT, workers=1, proxy_headers=True,
+                log_level=os.environ.get("LOG_LEVEL", "INFO").lower())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,56 +1,206 @@
 import base64
+import json
+import logging
 import os
-import re
-from openai import OpenAI
-import pandas as pd
-import pdfkit
-from PyPDF2 import PdfReader
-from docx import Document
+import uuid
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 
-load_dotenv()
-
-# Set up OpenAI API key - use the same key you're using for handwriting analysis
-API_KEY = os.environ.get("OPENAI_API_KEY", "not-set")
-LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o")
+from disk_cache import DiskCache, content_key
+from image_preprocessing import prepare_image_for_ocr, preprocess_signature
+from lazy_imports import lazy_module
+from llm_client import LLM_MODEL, chat_completion
+from observability import stage
+from ocr_tiling import OCR_TILE_CONCURRENCY, merge_transcripts, plan_ocr_images, tiling_signature
+from pdf_reports import PDF_ENGINE, PDFKIT_OPTIONS, render_student_report
+from report_templates import student_report_html
 
-client = OpenAI(api_key=API_KEY)
+pdfkit = lazy_module("pdfkit")
 
+load_dotenv()
 
-def encode_image(image_path):
+logger = logging.getLogger(__name__)
+
+OCR_PROMPT = "Extract the text from this image without modifying spelling or grammar."
+OCR_STRIP_PROMPT = (
+    OCR_PROMPT + " The image is one horizontal strip of a longer page; transcribe every line "
+    "that is visible, including lines partly cut off at the top or bottom edge."
+)
+# Bump whenever OCR_PROMPT or the OCR request changes so cached transcripts are not reused
+OCR_PROMPT_VERSION = "2"
+
+# "two_step": OCR call, then a grammar call on the text. "combined": one vision call
+# returns the transcript and the errors with character offsets (structured output)
+OCR_MODE = os.environ.get("OCR_MODE", "two_step").lower()
+
+COMBINED_PROMPT = (
+    "Transcribe the handwritten text in this image exactly as written, without correcting "
+    "spelling or grammar. Then list every spelling and grammar mistake in your transcript: "
+    "the incorrect text exactly as it appears, the correction, the category (Spelling or Grammar), "
+    "and the start and end character offsets of the incorrect text in your transcript "
+    "(0-based, end exclusive)."
+)
+COMBINED_PROMPT_VERSION = "1"
+COMBINED_MAX_TOKENS = int(os.environ.get("OCR_COMBINED_MAX_TOKENS", "2000"))
+COMBINED_SCHEMA = {
+    "name": "graded_page",
+    "strict": True,
+    "schema": {
+        "type": "object",
+        "properties": {
+            "text": {"type": "string"},
+            "errors": {
+                "type": "array",
+                "items": {
+                    "type": "object",
+                    "properties": {
+                        "incorrect": {"type": "string"},
+                        "correct": {"type": "string"},
+                        "category": {"type": "string", "enum": ["Spelling", "Grammar"]},
+                        "start": {"type": "integer"},
+                        "end": {"type": "integer"},
+                    },
+                    "required": ["incorrect", "correct", "category", "start", "end"],
+                    "additionalProperties": False,
+                },
+            },
+        },
+        "required": ["text", "errors"],
+        "additionalProperties": False,
+    },
+}
+
+ocr_cache = DiskCache(
+    "ocr",
+    max_entries=int(os.environ.get("OCR_CACHE_MAX_ENTRIES", "10000")),
+    max_bytes=int(os.environ.get("OCR_CACHE_MAX_MB", "256")) * 1024 * 1024,
+    max_age=int(os.environ.get("OCR_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+)
+
+
+def extract_text_from_image(image_path, use_cache=True):
+    """OCR an image; identical image bytes are answered from the OCR cache.
+
+    Tall or dense pages are sent as overlapping strips in parallel and the strip
+    transcripts stitched together; max_tokens is sized from the detected line count.
+    With use_cache=False the cache is not consulted but is refreshed with the new result.
+    """
     with open(image_path, "rb") as image_file:
-        return base64.b64encode(image_file.read()).decode("utf-8")
-
+        image_bytes = image_file.read()
+    cache_key = content_key(image_bytes, LLM_MODEL, OCR_PROMPT_VERSION, preprocess_signature(), tiling_signature())
+    if use_cache:
+        cached = ocr_cache.get(cache_key)
+        if cached is not None:
+            return cached["text"]
+
+    with stage("image_encoding"):
+        payload, mime_type = prepare_image_for_ocr(image_bytes, image_path)
+        tiles = plan_ocr_images(payload, mime_type)
+
+    with stage("ocr_call"):
+        if len(tiles) == 1:
+            texts = [_ocr_image(*tiles[0], prompt=OCR_PROMPT)]
+        else:
+            logger.debug("OCR %s in %d strips", os.path.basename(image_path), len(tiles))
+            # Strips of one page are OCRed in parallel (at most OCR_TILE_CONCURRENCY per page);
+            # llm_client's limits bound the process as a whole
+            with ThreadPoolExecutor(max_workers=min(OCR_TILE_CONCURRENCY, len(tiles)),
+                                    thread_name_prefix="ocr-tile") as executor:
+                texts = list(executor.map(lambda tile: _ocr_image(*tile, prompt=OCR_STRIP_PROMPT), tiles))
+    text = merge_transcripts(texts) if len(texts) > 1 else texts[0]
+    # A strip without an answer leaves a hole in the page, so only complete transcripts are cached
+    if text and all(texts):
+        ocr_cache.set(cache_key, {"text": text})
+    return text
 
-def extract_text_from_image(image_path):
-    image_base64 = f"data:image/jpeg;base64,{encode_image(image_path)}"
 
-    response = client.chat.completions.create(
-        model=LLM_MODEL,
+def _ocr_image(payload, mime_type, max_tokens, prompt):
+    image_base64 = f"data:{mime_type};base64,{base64.b64encode(payload).decode('utf-8')}"
+    response = chat_completion(
         messages=[
             {
                 "role": "user",
                 "content": [
                     {
                         "type": "text",
-                        "text": "Extract the text from this image without modifying spelling or grammar.",
+                        "text": prompt,
                     },
                     {"type": "image_url", "image_url": {"url": image_base64}},
                 ],
             },
         ],
-        max_tokens=500,
+        max_tokens=max_tokens,
     )
-    return response.choices[0].message.content
+    choice = response.choices[0]
+    if choice.finish_reason == "length":
+        logger.warning("OCR answer truncated at max_tokens=%d", max_tokens)
+    return choice.message.content
+
 
+def extract_and_check_image(image_path, use_cache=True):
+    """OCR and grammar check in one structured-output vision call (OCR_MODE=combined).
 
-def correct_spelling_grammar(text):
-    response = client.chat.completions.create(
-        model="gpt-4o",
+    Returns {"text": ..., "errors": [{incorrect, correct, category, start, end}, ...]},
+    or None if the model's answer could not be parsed (e.g. it hit max_tokens), so the
+    caller can fall back to the two-step pipeline. Results share the OCR cache.
+    """
+    with open(image_path, "rb") as image_file:
+        image_bytes = image_file.read()
+    cache_key = content_key(image_bytes, LLM_MODEL, "combined", COMBINED_PROMPT_VERSION, preprocess_signature())
+    if use_cache:
+        cached = ocr_cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+    with stage("image_encoding"):
+        payload, mime_type = prepare_image_for_ocr(image_bytes, image_path)
+        image_base64 = f"data:{mime_type};base64,{base64.b64encode(payload).decode('utf-8')}"
+
+    with stage("combined_call"):
+        response = chat_completion(
+            messages=[
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": COMBINED_PROMPT},
+                        {"type": "image_url", "image_url": {"url": image_base64}},
+                    ],
+                },
+            ],
+            response_format={"type": "json_schema", "json_schema": COMBINED_SCHEMA},
+            max_tokens=COMBINED_MAX_TOKENS,
+        )
+    choice = response.choices[0]
+    try:
+        result = json.loads(choice.message.content or "")
+        text, errors = result["text"], result["errors"]
+    except (ValueError, KeyError, TypeError):
+        logger.warning("Combined OCR answer for %s was not valid JSON (finish_reason=%s); falling back to two calls",
+                       os.path.basename(image_path), choice.finish_reason)
+        return None
+    if not isinstance(text, str) or not isinstance(errors, list):
+        return None
+
+    result = {"text": text, "errors": [error for error in errors if isinstance(error, dict)]}
+    if text:
+        ocr_cache.set(cache_key, result)
+    return result
+
+
+GRAMMAR_ONLY_PROMPT = (
+    "You are an expert in spelling and grammar correction. Spelling mistakes have already been "
+    "marked, so identify only grammar errors (agreement, tense, word order, articles, word choice, "
+    "punctuation) and provide corrections in 'Incorrect -> Correct -> Category' format."
+)
+
+
+@stage("grammar_call")
+def correct_spelling_grammar(text, grammar_only=False):
+    response = chat_completion(
         messages=[
             {
                 "role": "system",
-                "content": "You are an expert in spelling and grammar correction. Identify errors and provide corrections in 'Incorrect -> Correct -> Category' format.",
+                "content": GRAMMAR_ONLY_PROMPT if grammar_only else "You are an expert in spelling and grammar correction. Identify errors and provide corrections in 'Incorrect -> Correct -> Category' format.",
             },
             {
                 "role": "user",
@@ -60,7 +210,7 @@ def correct_spelling_grammar(text):
     )
 
     corrected_text = response.choices[0].message.content.strip()
-    print("DEBUG: GPT Response:\n", corrected_text)  # Debugging
+    logger.debug("Grammar check response:\n%s", corrected_text)
 
     # Ensure correct parsing
     errors = []
@@ -70,218 +220,41 @@ def correct_spelling_grammar(text):
             if len(parts) == 3:
                 errors.append([parts[0].strip(), parts[1].strip(), parts[2].strip()])
 
-    print("DEBUG: Parsed Errors:", errors)  # Debugging
+    logger.debug("Parsed errors: %s", errors)
 
     return errors  # Ensure it's a list of lists
 
 
-def mark_text(text, df):
-    corrections = df.to_dict(orient="records")
-    for correction in corrections:
-        incorrect_text = correction["Incorrect Text"]
-        category = correction["Error Category"]
-        if "Spelling" in category:
-            text = re.sub(
-                re.escape(incorrect_text),
-                f'<span style="color:red;">{incorrect_text}</span>',
-                text,
-            )
-        elif "Grammar" in category:
-            text = re.sub(
-                re.escape(incorrect_text),
-                f'<span style="color:blue;">{incorrect_text}</span>',
-                text,
-            )
-    return text
-
-
-PDF_DIRECTORY = "generated_pdfs"
+PDF_DIRECTORY = os.environ.get("PDF_DIRECTORY", os.path.join(os.path.dirname(os.path.abspath(__file__)), "generated_pdfs"))
 
 if not os.path.exists(PDF_DIRECTORY):
     os.makedirs(PDF_DIRECTORY)
 
 
-def create_pdf(student_name, student_class, subject, results):
-    pdf_file_path = os.path.join(PDF_DIRECTORY, "student_report.pdf")  # Single PDF file
-
-    # ✅ Start HTML Formatting for the PDF
-    html_content = f"""
-    <html>
-    <head>
-        <style>
-            body {{
-                font-family: Arial, sans-serif;
-                margin: 20px;
-            }}
-            h1, h2, h3 {{
-                color: #333;
-            }}
-            p {{
-                font-size: 14px;
-                color: #444;
-            }}
-            .highlight-red {{
-                color: red;
-                font-weight: bold;
-            }}
-            .highlight-green {{
-                color: green;
-                font-weight: bold;
-            }}
-            .highlight-blue {{
-                color: blue;
-                font-weight: bold;
-            }}
-            .error-table {{
-                width: 100%;
-                border-collapse: collapse;
-                margin-top: 15px;
-                font-size: 14px;
-            }}
-            .error-table th, .error-table td {{
-                border: 1px solid #ddd;
-                padding: 8px;
-                text-align: left;
-            }}
-            .error-table th {{
-                background-color: #f2f2f2;
-                color: black;
-            }}
-            .error-table td:nth-child(1) {{
-                color: red;
-                font-weight: bold;
-            }}
-            .error-table td:nth-child(2) {{
-                color: green;
-                font-weight: bold;
-            }}
-            .error-table td:nth-child(3) {{
-                color: blue;
-                font-weight: bold;
-            }}
-            .section-divider {{
-                margin-top: 30px;
-                border-top: 3px solid #000;
-            }}
-            .extracted-text {{
-                background-color: #f9f9f9;
-                border: 1px solid #ddd;
-                padding: 10px;
-                font-size: 14px;
-            }}
-            .marked-text {{
-                background-color: #f3f3f3;
-                border: 1px solid #bbb;
-                padding: 10px;
-                font-size: 14px;
-            }}
-            sup {{
-                font-size: 10px;
-                vertical-align: super;
-                color: red;
-            }}
-        </style>
-    </head>
-    <body>
-        <h1 style="text-align:center;">Student Report</h1>
-        <p><strong>Student Name:</strong> {student_name}</p>
-        <p><strong>Class:</strong> {student_class}</p>
-        <p><strong>Subject:</strong> {subject}</p>
-    """
-
-    # ✅ Loop through all images and results
-    for i, result in enumerate(results):
-        image = result.get("image", "")
-        extracted_text = result.get("extractedText", "No text extracted")
-        marked_text = result.get("markedText", "No marked text available")
-        error_table_data = result.get("errorTable", [])
-
-        # ✅ Ensure error data is a valid DataFrame
-        error_df = pd.DataFrame(error_table_data)
-
-        if not error_df.empty:
-            # ✅ Fix KeyError by renaming columns to a standard format
-            expected_columns = {
-                "incorrectText": "Incorrect Text",
-                "correctText": "Correct Text",
-                "errorCategory": "Error Category",
-            }
-
-            # Rename columns if necessary
-            error_df.rename(columns=expected_columns, inplace=True)
-
-            # ✅ Validate that expected columns exist in the DataFrame
-            for col in ["Incorrect Text", "Correct Text", "Error Category"]:
-                if col not in error_df.columns:
-                    print(f"⚠️ Warning: Column {col} missing in error table.")
-                    error_df[col] = ""  # Add missing columns with empty values
-
-        # ✅ Process extracted text to add superscripts (G/S)
-        for _, row in error_df.iterrows():
-            incorrect_word = row["Incorrect Text"]
-            error_type = row["Error Category"]
-
-            if "Spelling" in error_type:
-                superscript = "<sup>S</sup>"  # S for Spelling
-            else:
-                superscript = "<sup>G</sup>"  # G for Grammar
-
-            extracted_text = extracted_text.replace(
-                incorrect_word, f"{incorrect_word}{superscript}"
-            )
-
-        # ✅ Format the error table
-        error_table_html = """
-        <table class="error-table">
-            <tr>
-                <th>Incorrect Text (🔴 Red)</th>
-                <th>Correct Text (🟢 Green)</th>
-                <th>Error Category (🔵 Blue)</th>
-            </tr>
-        """
-        for _, row in error_df.iterrows():
-            error_table_html += f"""
-            <tr>
-                <td class="highlight-red">{row["Incorrect Text"]}</td>
-                <td class="highlight-green">{row["Correct Text"]}</td>
-                <td class="highlight-blue">{row["Error Category"]}</td>
-            </tr>
-            """
-        error_table_html += (
-            "</table>" if not error_df.empty else "<p>No errors found.</p>"
-        )
-
-        # ✅ Add sections for each image
-        html_content += f"""
-        <div class="section-divider"></div>
-        <h2>Image {i + 1}</h2>
-        
-        <h3>Uploaded Image:</h3>
-        <img src="{image}" style="width:100%; max-height:400px;" />
-
-        <h3>Extracted Text (Errors Marked in Superscript):</h3>
-        <p class="extracted-text">{extracted_text}</p>
-
-        <h3>Errors in the Text:</h3>
-        {error_table_html}
+@stage("pdf_render")
+def create_pdf(student_name, student_class, subject, results, pdf_file_path=None):
+    """Render the student report to a unique file in PDF_DIRECTORY and return its path"""
+    if pdf_file_path is None:
+        pdf_file_path = os.path.join(PDF_DIRECTORY, f"student_report_{uuid.uuid4().hex}.pdf")
 
-        <h3>Marked Text:</h3>
-        <p class="marked-text">{marked_text}</p>
-        """
+    if PDF_ENGINE == "fpdf":
+        render_student_report(pdf_file_path, student_name, student_class, subject, results)
+        logger.debug("PDF saved: %s", pdf_file_path)
+        return pdf_file_path
 
-    html_content += "</body></html>"
-
-    # ✅ Generate the PDF with the improved formatting
     pdfkit.from_string(
-        html_content, pdf_file_path, options={"enable-local-file-access": ""}
+        student_report_html(student_name, student_class, subject, results), pdf_file_path, options=PDFKIT_OPTIONS
     )
-
-    print(f"✅ PDF successfully saved: {pdf_file_path}")  # Debugging
+    logger.debug("PDF saved: %s", pdf_file_path)
 
     return pdf_file_path
 
 
 def pdf_to_word(pdf_path, word_path):
+    # Not served by any route; PyPDF2 and python-docx are only imported when it is called
+    from PyPDF2 import PdfReader
+    from docx import Document
+
     pdf_reader = PdfReader(pdf_path)
     word_doc = Document()
     for page in pdf_reader.pages:
@@ -0,0 +1,130 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import zipfile
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+
+from werkzeug.utils import secure_filename
+
+from pdf_reports import PDF_ENGINE, render_student_report
+
+# Report-rendering processes shared by all batch requests (defaults to one per CPU)
+BATCH_PDF_WORKERS = int(os.environ.get("BATCH_PDF_WORKERS", "0")) or os.cpu_count() or 1
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_executor():
+    """Process pool created on first use; spawn avoids forking a threaded server process"""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=BATCH_PDF_WORKERS, mp_context=multiprocessing.get_context("spawn")
+            )
+        return _executor
+
+
+def _discard_executor(executor):
+    """Forget a pool whose worker died so the next batch starts a fresh one"""
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False, cancel_futures=True)
+
+
+def render_report(pdf_path, student_name, student_class, subject, results):
+    """Runs in a worker process: render one student's report to pdf_path"""
+    if PDF_ENGINE == "fpdf":
+        render_student_report(pdf_path, student_name, student_class, subject, results)
+    else:
+        from backend_handwriting import create_pdf
+        create_pdf(student_name, student_class, subject, results, pdf_file_path=pdf_path)
+    return os.path.getsize(pdf_path)
+
+
+class _ChunkSink:
+    """Write-only, unseekable file object; zipfile then streams entries with data descriptors"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self._chunks:
+            data = b"".join(self._chunks)
+            self._chunks = []
+            yield data
+
+
+def iter_reports_zip(students):
+    """Render students' reports in the process pool and yield a ZIP archive as they finish.
+
+    students is a list of dicts with studentName, studentClass, subject and
+    results (already prepared for create_pdf), or an "error" key for entries that
+    could not be prepared. Failures are recorded in manifest.json instead of
+    aborting the batch.
+    """
+    sink = _ChunkSink()
+    work_dir = tempfile.mkdtemp(prefix="batch_reports_")
+    futures = {}
+    reports, failures = [], []
+    started = time.time()
+    try:
+        with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_STORED) as archive:
+            executor = get_executor()
+            for index, student in enumerate(students):
+                name = student.get("studentName") or "Unknown"
+                arcname = f"{index + 1:03d}_{secure_filename(name) or 'student'}.pdf"
+                if student.get("error"):
+                    failures.append({"index": index, "studentName": name, "error": student["error"]})
+                    continue
+                pdf_path = os.path.join(work_dir, arcname)
+                future = executor.submit(
+                    render_report, pdf_path, name, student.get("studentClass", "Unknown"),
+                    student.get("subject", "Unknown"), student["results"],
+                )
+                futures[future] = (index, name, arcname, pdf_path)
+
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    index, name, arcname, pdf_path = futures[future]
+                    try:
+                        future.result()
+                        archive.write(pdf_path, arcname)
+                        os.remove(pdf_path)
+                        reports.append({"index": index, "studentName": name, "file": arcname})
+                    except BrokenProcessPool as e:
+                        failures.append({"index": index, "studentName": name, "error": str(e)})
+                        _discard_executor(executor)
+                    except Exception as e:
+                        failures.append({"index": index, "studentName": name, "error": str(e)})
+                    yield from sink.drain()
+
+            manifest = {
+                "reports": sorted(reports, key=lambda item: item["index"]),
+                "failures": sorted(failures, key=lambda item: item["index"]),
+                "seconds": round(time.time() - started, 2),
+            }
+            archive.writestr("manifest.json", json.dumps(manifest, indent=2, ensure_ascii=False))
+        yield from sink.drain()
+    finally:
+        # Also runs when the client goes away mid-download
+        for future in futures:
+            future.cancel()
+        shutil.rmtree(work_dir, ignore_errors=True)
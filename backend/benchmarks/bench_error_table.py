@@ -0,0 +1,71 @@
+"""Per-page overhead of building and serialising a page's error table.
+
+Compares the former pandas path (DataFrame construction, to_dict(orient='records'),
+iterrows() for marking and the PDF) with error_table.ErrorTable. pandas is only
+needed for the "before" numbers and is skipped when it is not installed.
+
+    python benchmarks/bench_error_table.py [--errors 8] [--number 20000]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from error_table import ErrorTable  # noqa: E402
+
+COLUMNS = ["Incorrect Text", "Correct Text", "Error Category"]
+
+
+def sample_rows(count):
+    return [[f"{i}. wrod{i}", f"word{i}", "Spelling error" if i % 2 else "Grammar"] for i in range(count)]
+
+
+def error_table_page(count):
+    table = ErrorTable.from_llm_output(sample_rows(count))
+    records = table.to_records()
+    rows = table.rows()
+    for _ in ErrorTable.from_records(records):
+        pass
+    return rows
+
+
+def pandas_page(pd, count):
+    rows = sample_rows(count)
+    for entry in rows:
+        entry[2] = 'Spelling' if 'spell' in entry[2].lower() else 'Grammar'
+    df = pd.DataFrame(rows, columns=COLUMNS)
+    records = df.to_dict(orient='records')
+    for _, row in pd.DataFrame(records).iterrows():
+        row["Incorrect Text"]
+    return records
+
+
+def import_seconds(module):
+    code = f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"
+    out = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return float(out.stdout) if out.returncode == 0 else None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--errors", type=int, default=8, help="errors per page")
+    parser.add_argument("--number", type=int, default=20000, help="pages per measurement")
+    args = parser.parse_args()
+
+    after = min(timeit.repeat(lambda: error_table_page(args.errors), number=args.number, repeat=3)) / args.number
+    print(f"ErrorTable : {after * 1e6:9.1f} µs/page   import {import_seconds('error_table') or 0:.3f}s")
+    try:
+        import pandas as pd
+    except ImportError:
+        print("pandas     : not installed, skipping the 'before' measurement")
+        return
+    before = min(timeit.repeat(lambda: pandas_page(pd, args.errors), number=max(args.number // 20, 1), repeat=3)) / max(args.number // 20, 1)
+    print(f"pandas     : {before * 1e6:9.1f} µs/page   import {import_seconds('pandas') or 0:.3f}s")
+    print(f"speed-up   : {before / after:9.1f}x")
+
+
+if __name__ == "__main__":
+    main()
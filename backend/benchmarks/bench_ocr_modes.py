@@ -0,0 +1,97 @@
+"""Compare the two-step OCR + grammar pipeline with OCR_MODE=combined on a fixed image set.
+
+Grades every image once per mode with the OCR cache bypassed and reports, per mode,
+LLM round trips, prompt/completion tokens and page latency (mean, p50, max), plus
+how closely the two modes agree on the transcript and the errors found. This calls
+the configured OpenAI endpoint (OPENAI_BASE_URL), so it costs real tokens.
+
+    python benchmarks/bench_ocr_modes.py [--images 'uploads/*.jpeg'] [--limit 10]
+"""
+import argparse
+import difflib
+import glob
+import os
+import statistics
+import sys
+import threading
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+import grading  # noqa: E402
+import llm_client  # noqa: E402
+
+MODES = ("two_step", "combined")
+
+
+class UsageCounter:
+    """Wraps client.chat.completions.create to count round trips and tokens"""
+
+    def __init__(self, completions):
+        self.completions = completions
+        self.create = completions.create
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.calls = self.prompt_tokens = self.completion_tokens = 0
+
+    def __call__(self, *args, **kwargs):
+        response = self.create(*args, **kwargs)
+        with self.lock:
+            self.calls += 1
+            if response.usage:
+                self.prompt_tokens += response.usage.prompt_tokens
+                self.completion_tokens += response.usage.completion_tokens
+        return response
+
+
+def run(mode, images, counter):
+    grading.OCR_MODE = mode
+    counter.reset()
+    latencies, results = [], []
+    for image in images:
+        start = time.perf_counter()
+        results.append(grading.grade_image(image, use_cache=False))
+        latencies.append(time.perf_counter() - start)
+    pages = len(images)
+    print(f"{mode:9s} calls/page={counter.calls / pages:4.2f}  "
+          f"tokens/page={counter.prompt_tokens / pages:7.0f} in {counter.completion_tokens / pages:6.0f} out  "
+          f"latency mean={statistics.mean(latencies):5.2f}s p50={statistics.median(latencies):5.2f}s "
+          f"max={max(latencies):5.2f}s")
+    return results
+
+
+def agreement(two_step, combined):
+    text_ratios, error_overlap = [], []
+    for a, b in zip(two_step, combined):
+        text_ratios.append(difflib.SequenceMatcher(None, a["extractedText"], b["extractedText"]).ratio())
+        errors_a = {record["Incorrect Text"] for record in a["errorTable"]}
+        errors_b = {record["Incorrect Text"] for record in b["errorTable"]}
+        if errors_a or errors_b:
+            error_overlap.append(len(errors_a & errors_b) / len(errors_a | errors_b))
+    print(f"transcript similarity mean={statistics.mean(text_ratios):.3f}  "
+          f"error-set Jaccard mean={statistics.mean(error_overlap) if error_overlap else 1.0:.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--images", default=os.path.join(BACKEND_DIR, "uploads", "*.jp*g"))
+    parser.add_argument("--limit", type=int, default=10)
+    args = parser.parse_args()
+
+    images = sorted(glob.glob(args.images))[:args.limit]
+    if not images:
+        sys.exit(f"No images match {args.images}")
+    print(f"{len(images)} images, model {llm_client.LLM_MODEL}")
+
+    completions = llm_client.get_client().chat.completions
+    counter = UsageCounter(completions)
+    completions.create = counter
+    results = {mode: run(mode, images, counter) for mode in MODES}
+    agreement(results["two_step"], results["combined"])
+
+
+if __name__ == "__main__":
+    main()
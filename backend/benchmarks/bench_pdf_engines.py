@@ -0,0 +1,93 @@
+"""Report throughput of the in-process fpdf engine versus the pdfkit/wkhtmltopdf path.
+
+Renders the same synthetic student report (pages of text, an error table and one
+embedded upload per page) with each engine, sequentially and from a thread pool,
+and prints reports/second. The pdfkit engine is skipped if wkhtmltopdf is missing.
+
+    python benchmarks/bench_pdf_engines.py [--reports 20] [--pages 3] [--threads 4] [--image PATH]
+"""
+import argparse
+import glob
+import os
+import shutil
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+os.environ.setdefault("OPENAI_API_KEY", "benchmark")
+
+import backend_handwriting  # noqa: E402
+from marking import find_error_spans  # noqa: E402
+
+TEXT = (
+    "Despite his doutbs, Finn decided to test the compas. He ventureod into the forest, "
+    "where he has never dared to go before. The path was overgrown, and the storm made the air thick with mist. "
+) * 3
+ERRORS = [
+    ("doutbs", "doubts", "Spelling"),
+    ("compas", "compass", "Spelling"),
+    ("ventureod", "ventured", "Spelling"),
+    ("he has never", "he had never", "Grammar"),
+]
+
+
+def sample_results(pages, image):
+    spans = find_error_spans(TEXT, ERRORS)
+    return [
+        {
+            "image": image,
+            "extractedText": TEXT,
+            "errorTable": [{"Incorrect Text": a, "Correct Text": b, "Error Category": c} for a, b, c in ERRORS],
+            "errorSpans": spans,
+            "markedText": TEXT,
+        }
+        for _ in range(pages)
+    ]
+
+
+def run(engine, reports, threads, results, out_dir):
+    backend_handwriting.PDF_ENGINE = engine
+
+    def render(i):
+        path = os.path.join(out_dir, f"{engine}_{i}.pdf")
+        backend_handwriting.create_pdf("Bench Student", "7b", "English", results, pdf_file_path=path)
+        return os.path.getsize(path)
+
+    start = time.perf_counter()
+    if threads > 1:
+        with ThreadPoolExecutor(max_workers=threads) as executor:
+            sizes = list(executor.map(render, range(reports)))
+    else:
+        sizes = [render(i) for i in range(reports)]
+    elapsed = time.perf_counter() - start
+    print(f"{engine:7s} threads={threads:<2d} {reports / elapsed:7.2f} reports/s  "
+          f"{1000 * elapsed / reports:8.1f} ms/report  {sum(sizes) / len(sizes) / 1024:8.0f} KiB/report")
+
+
+def main():
+    default_images = sorted(glob.glob(os.path.join(BACKEND_DIR, "uploads", "*.jp*g")))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--reports", type=int, default=20)
+    parser.add_argument("--pages", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=4)
+    parser.add_argument("--image", default=default_images[0] if default_images else "")
+    args = parser.parse_args()
+
+    results = sample_results(args.pages, args.image)
+    engines = ["fpdf"]
+    if shutil.which("wkhtmltopdf"):
+        engines.append("pdfkit")
+    else:
+        print("wkhtmltopdf not found, skipping the pdfkit engine")
+
+    with tempfile.TemporaryDirectory() as out_dir:
+        for engine in engines:
+            for threads in (1, args.threads):
+                run(engine, args.reports, threads, results, out_dir)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Startup import cost of the backend from `python -X importtime`, checked against a budget.
+
+Imports app (or --module) in a fresh interpreter --runs times, with a temporary
+database and cache and APP_PRELOAD=off, and prints the median import time, the
+slowest imports below it and any heavy module that was imported although it
+should load on first use. Exits 1 when the median exceeds --budget-ms or a
+--forbid module was imported, so it can guard startup time in CI.
+
+    python benchmarks/bench_startup.py [--runs 5] [--budget-ms 500] [--top 15] [--module app]
+        [--forbid openai,httpx,cv2,numpy,PIL,fpdf,pdfkit,PyPDF2,docx]
+"""
+import argparse
+import os
+import re
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules behind lazy_imports.lazy_module (or imported inside functions) in the backend
+HEAVY_MODULES = "openai,httpx,cv2,numpy,PIL,fpdf,pdfkit,PyPDF2,docx"
+
+_LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \| (\s*)(\S+)$")
+
+
+def parse_importtime(stderr):
+    """[(name, depth, self_us, cumulative_us)] in the order -X importtime prints them"""
+    entries = []
+    for line in stderr.splitlines():
+        match = _LINE.match(line)
+        if match:
+            own, cumulative, indent, name = match.groups()
+            entries.append((name, len(indent) // 2, int(own), int(cumulative)))
+    return entries
+
+
+def measure(module, work_dir):
+    env = dict(os.environ, APP_PRELOAD="off", OPENAI_API_KEY=os.environ.get("OPENAI_API_KEY", "benchmark"),
+               CACHE_DIR=os.path.join(work_dir, "cache"), SMARTMARKS_DB=os.path.join(work_dir, "smartmarks.db"))
+    start = time.perf_counter()
+    # os._exit skips the shutdown of background threads started at import
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}, os; os._exit(0)"],
+        cwd=BACKEND_DIR, env=env, capture_output=True, text=True,
+    )
+    wall = time.perf_counter() - start
+    if process.returncode != 0:
+        sys.exit(f"import {module} failed:\n{process.stderr[-2000:]}")
+    return parse_importtime(process.stderr), wall
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--module", default="app")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=500, help="median import time of --module")
+    parser.add_argument("--top", type=int, default=15, help="slowest imports to list")
+    parser.add_argument("--forbid", default=HEAVY_MODULES, help="modules that must not load at startup")
+    args = parser.parse_args()
+
+    totals, walls, runs = [], [], []
+    with tempfile.TemporaryDirectory(prefix="smartmarks_startup_") as work_dir:
+        for _ in range(args.runs):
+            entries, wall = measure(args.module, work_dir)
+            total = next((cumulative for name, depth, _, cumulative in entries
+                          if name == args.module and depth == 0), None)
+            if total is None:
+                sys.exit(f"{args.module} not found in the -X importtime output (already imported at startup?)")
+            totals.append(total / 1000)
+            walls.append(wall * 1000)
+            runs.append(entries)
+
+    median = statistics.median(totals)
+    entries = runs[totals.index(sorted(totals)[len(totals) // 2])]
+    print(f"import {args.module}: median {median:.0f} ms (min {min(totals):.0f}, max {max(totals):.0f}) "
+          f"over {args.runs} runs, process wall time median {statistics.median(walls):.0f} ms")
+
+    print(f"\nslowest imports below {args.module} (cumulative / self, ms):")
+    nested = [entry for entry in entries if entry[0] != args.module]
+    for name, depth, own, cumulative in sorted(nested, key=lambda entry: -entry[3])[:args.top]:
+        print(f"  {cumulative / 1000:8.1f} {own / 1000:8.1f}  {'  ' * depth}{name}")
+
+    forbidden = [name.strip() for name in args.forbid.split(",") if name.strip()]
+    imported = {name for name, _, _, _ in entries}
+    loaded = [name for name in forbidden if name in imported]
+
+    failed = False
+    if loaded:
+        print(f"\nFAIL imported at startup although loaded lazily: {', '.join(loaded)}")
+        failed = True
+    if median > args.budget_ms:
+        print(f"\nFAIL median import time {median:.0f} ms is over the {args.budget_ms:.0f} ms budget")
+        failed = True
+    if not failed:
+        print(f"\nOK within the {args.budget_ms:.0f} ms budget, no heavy module imported")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""Local OpenAI-compatible stand-in for load tests: canned answers, simulated latency and errors.
+
+Serves POST /v1/chat/completions and answers each of SmartMarks' prompts with a
+canned response of the right shape: OCR transcripts, combined OCR JSON, grammar
+lines, language detection and improvement suggestions. GET /stats returns request
+counts per kind. Point the backend at it with OPENAI_BASE_URL=http://127.0.0.1:8100/v1.
+
+Latency specs are in milliseconds: fixed:MS, uniform:LO:HI, normal:MEAN:SD,
+lognormal:MEDIAN:SIGMA or exponential:MEAN.
+
+    python benchmarks/fake_openai_server.py [--port 8100] [--latency lognormal:700:0.4]
+        [--vision-latency lognormal:2500:0.3] [--error-rate 0.01] [--rate-limit-rate 0.02]
+        [--responses canned.json]
+"""
+import argparse
+import json
+import math
+import random
+import threading
+import time
+import uuid
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+TRANSCRIPT = (
+    "Despite his doutbs, Finn decided to test the compas. He ventureod into the forest, "
+    "where he has never dared to go before. The path was overgrown, and the storm made the air thick with mist."
+)
+ERRORS = [
+    ("doutbs", "doubts", "Spelling"),
+    ("compas", "compass", "Spelling"),
+    ("ventureod", "ventured", "Spelling"),
+    ("he has never", "he had never", "Grammar"),
+]
+SUGGESTIONS = {
+    "style_improvements": ["Vary sentence openings.", "Prefer active verbs.", "Cut filler words."],
+    "vocabulary_enhancements": [{"original": "thick", "suggestions": ["dense", "heavy", "murky"]}],
+    "structure_suggestions": ["Open with the storm to set the scene.", "Add a closing sentence."],
+    "strengths": ["Clear sequence of events.", "Vivid setting."],
+}
+
+
+def default_responses():
+    combined_errors = [
+        {"incorrect": incorrect, "correct": correct, "category": category,
+         "start": TRANSCRIPT.find(incorrect), "end": TRANSCRIPT.find(incorrect) + len(incorrect)}
+        for incorrect, correct, category in ERRORS
+    ]
+    return {
+        "ocr": TRANSCRIPT,
+        "combined": json.dumps({"text": TRANSCRIPT, "errors": combined_errors}),
+        "grammar": "\n".join(f"{i + 1}. {a} -> {b} -> {c}" for i, (a, b, c) in enumerate(ERRORS)),
+        "language": "english",
+        "suggestions": json.dumps(SUGGESTIONS),
+        "other": "OK",
+    }
+
+
+def parse_latency(spec):
+    """Latency spec -> function returning a delay in seconds"""
+    kind, *values = spec.split(":")
+    try:
+        values = [float(value) for value in values]
+        if kind == "fixed":
+            ms, = values
+            return lambda: ms / 1000
+        if kind == "uniform":
+            low, high = values
+            return lambda: random.uniform(low, high) / 1000
+        if kind == "normal":
+            mean, sd = values
+            return lambda: max(0.0, random.gauss(mean, sd)) / 1000
+        if kind == "lognormal":
+            median, sigma = values
+            return lambda: random.lognormvariate(math.log(max(median, 1e-3)), sigma) / 1000
+        if kind == "exponential":
+            mean, = values
+            return lambda: random.expovariate(1 / mean) / 1000 if mean > 0 else 0.0
+    except ValueError:
+        pass
+    raise ValueError(f"invalid latency spec {spec!r}")
+
+
+def classify(body):
+    """Which SmartMarks prompt a chat.completions request is"""
+    messages = body.get("messages") or []
+    has_image = any(
+        isinstance(message.get("content"), list)
+        and any(part.get("type") == "image_url" for part in message["content"])
+        for message in messages
+    )
+    response_format = (body.get("response_format") or {}).get("type")
+    if has_image:
+        return "combined" if response_format == "json_schema" else "ocr"
+    system = " ".join(m.get("content") or "" for m in messages if m.get("role") == "system").lower()
+    if "language detection" in system:
+        return "language"
+    if "spelling and grammar" in system:
+        return "grammar"
+    if response_format == "json_object":
+        return "suggestions"
+    return "other"
+
+
+class FakeOpenAI(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = None
+    counts = Counter()
+    counts_lock = threading.Lock()
+
+    def log_message(self, format, *args):
+        if self.config.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status, payload, headers=None):
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path.rstrip("/").endswith("/stats"):
+            with self.counts_lock:
+                self.send_json(200, dict(self.counts))
+        else:
+            self.send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_json(404, {"error": {"message": "not found", "type": "invalid_request_error"}})
+            return
+        kind = classify(body)
+        config = self.config
+        time.sleep((config.vision_latency if kind in ("ocr", "combined") else config.latency)())
+
+        roll = random.random()
+        if roll < config.rate_limit_rate:
+            self.count("429")
+            self.send_json(429, {"error": {"message": "Rate limit reached", "type": "rate_limit_exceeded"}},
+                           headers={"retry-after-ms": str(config.retry_after_ms)})
+            return
+        if roll < config.rate_limit_rate + config.error_rate:
+            self.count("500")
+            self.send_json(500, {"error": {"message": "Simulated server error", "type": "server_error"}})
+            return
+
+        self.count(kind)
+        content = config.responses.get(kind, config.responses["other"])
+        prompt_tokens = len(json.dumps(body.get("messages", []))) // 4
+        completion_tokens = len(content) // 4 + 1
+        self.send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}],
+            "usage": {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+                      "total_tokens": prompt_tokens + completion_tokens},
+        })
+
+    def count(self, kind):
+        with self.counts_lock:
+            self.counts[kind] += 1
+
+
+def make_server(host="127.0.0.1", port=8100, latency="lognormal:700:0.4", vision_latency="lognormal:2500:0.3",
+                error_rate=0.0, rate_limit_rate=0.0, retry_after_ms=500, responses=None, verbose=False):
+    """ThreadingHTTPServer ready for serve_forever(); also used by load_test.py --spawn"""
+    config = argparse.Namespace(
+        latency=parse_latency(latency), vision_latency=parse_latency(vision_latency),
+        error_rate=error_rate, rate_limit_rate=rate_limit_rate, retry_after_ms=retry_after_ms,
+        responses={**default_responses(), **(responses or {})}, verbose=verbose,
+    )
+    handler = type("ConfiguredFakeOpenAI", (FakeOpenAI,), {"config": config, "counts": Counter()})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", default="lognormal:700:0.4", help="text prompts")
+    parser.add_argument("--vision-latency", default="lognormal:2500:0.3", help="prompts with an image")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="share answered with a 429")
+    parser.add_argument("--retry-after-ms", type=int, default=500)
+    parser.add_argument("--responses", help="JSON file overriding canned answers by kind "
+                                            "(ocr, combined, grammar, language, suggestions, other)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    responses = None
+    if args.responses:
+        with open(args.responses, encoding="utf-8") as fh:
+            responses = json.load(fh)
+    server = make_server(args.host, args.port, args.latency, args.vision_latency, args.error_rate,
+                         args.rate_limit_rate, args.retry_after_ms, responses, args.verbose)
+    print(f"Fake OpenAI API on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,44 @@
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.environ.get("SMARTMARKS_DB", os.path.join(BASE_DIR, "data", "smartmarks.db"))
+
+_local = threading.local()
+
+
+def get_connection(db_path=None):
+    """Per-thread SQLite connection in WAL mode, shared by every store in the process"""
+    db_path = db_path or DB_PATH
+    connections = getattr(_local, "connections", None)
+    if connections is None:
+        connections = _local.connections = {}
+    conn = connections.get(db_path)
+    if conn is None:
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA busy_timeout=30000")
+        connections[db_path] = conn
+    return conn
+
+
+def init_schema(schema, db_path=None):
+    get_connection(db_path).executescript(schema)
+
+
+@contextmanager
+def transaction(db_path=None):
+    """BEGIN IMMEDIATE ... COMMIT on this thread's connection, rolled back on error"""
+    conn = get_connection(db_path)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
@@ -0,0 +1,172 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from observability import CACHE_LOOKUPS
+
+CACHE_ROOT = os.environ.get(
+    "CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "cache")
+)
+
+
+def content_key(*parts):
+    """SHA-256 over the given parts (bytes or str), used as a cache key"""
+    digest = hashlib.sha256()
+    for part in parts:
+        if isinstance(part, str):
+            part = part.encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+def file_sha256(path, chunk_size=1 << 20):
+    """SHA-256 of a file's bytes, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class DiskCache:
+    """JSON values stored one file per key, evicted LRU by count, size and age.
+
+    The file mtime doubles as the last-access time, so recency survives restarts
+    and is shared between worker processes using the same directory. Entry count
+    and size are tracked as values are written; the directory is only scanned when
+    a limit is exceeded, every SCAN_EVERY writes or SCAN_INTERVAL seconds (to expire
+    old entries and pick up other processes' writes). A scan evicts down to
+    LOW_WATERMARK of the limits, so a full cache is not rescanned on every write.
+    """
+
+    SCAN_EVERY = 1000
+    SCAN_INTERVAL = 3600
+    LOW_WATERMARK = 0.9
+
+    def __init__(self, name, max_entries=10000, max_bytes=256 * 1024 * 1024, max_age=30 * 24 * 3600):
+        self.name = name
+        self.directory = os.path.join(CACHE_ROOT, name)
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._scan_lock = threading.Lock()
+        # Unknown until the first scan, which the first write triggers
+        self._entries = None
+        self._bytes = 0
+        self._writes_since_scan = 0
+        self._last_scan = 0.0
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if self.max_age and time.time() - os.path.getmtime(path) > self.max_age:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path, "r", encoding="utf-8") as fh:
+                value = json.load(fh)
+            os.utime(path)
+        except (OSError, ValueError):
+            with self._lock:
+                self.misses += 1
+            CACHE_LOOKUPS.inc(cache=self.name, result="miss")
+            return None
+        with self._lock:
+            self.hits += 1
+        CACHE_LOOKUPS.inc(cache=self.name, result="hit")
+        return value
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as fh:
+            json.dump(value, fh, ensure_ascii=False)
+        size = os.path.getsize(tmp_path)
+        try:
+            replaced = os.path.getsize(path)
+        except OSError:
+            replaced = None
+        os.replace(tmp_path, path)
+
+        with self._lock:
+            if self._entries is not None:
+                self._entries += replaced is None
+                self._bytes += size - (replaced or 0)
+            self._writes_since_scan += 1
+            due = (
+                self._entries is None
+                or self._entries > self.max_entries
+                or self._bytes > self.max_bytes
+                or self._writes_since_scan >= self.SCAN_EVERY
+                or time.time() - self._last_scan > self.SCAN_INTERVAL
+            )
+        if due:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries, then least recently used ones until within LOW_WATERMARK of the limits"""
+        # One scan at a time; writers arriving meanwhile skip it rather than queue up
+        if not self._scan_lock.acquire(blocking=False):
+            return
+        try:
+            now = time.time()
+            entries = []
+            for entry in os.scandir(self.directory):
+                if not entry.name.endswith(".json"):
+                    continue
+                try:
+                    stat = entry.stat()
+                except OSError:
+                    continue
+                if self.max_age and now - stat.st_mtime > self.max_age:
+                    self._remove(entry.path)
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total_bytes = sum(size for _, size, _ in entries)
+            if len(entries) > self.max_entries or total_bytes > self.max_bytes:
+                entries.sort()
+                max_entries = int(self.max_entries * self.LOW_WATERMARK)
+                max_bytes = int(self.max_bytes * self.LOW_WATERMARK)
+                evicted = 0
+                while evicted < len(entries) and (len(entries) - evicted > max_entries or total_bytes > max_bytes):
+                    _, size, path = entries[evicted]
+                    evicted += 1
+                    total_bytes -= size
+                    self._remove(path)
+                entries = entries[evicted:]
+            with self._lock:
+                self._entries = len(entries)
+                self._bytes = total_bytes
+                self._writes_since_scan = 0
+                self._last_scan = now
+        finally:
+            self._scan_lock.release()
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            return
+        with self._lock:
+            self.evictions += 1
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else 0.0,
+            }
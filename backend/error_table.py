@@ -0,0 +1,82 @@
+import re
+from dataclasses import dataclass
+
+COLUMNS = ("Incorrect Text", "Correct Text", "Error Category")
+
+# The frontend sends error tables back with camelCase keys
+_KEY_ALIASES = {
+    "incorrectText": "Incorrect Text",
+    "correctText": "Correct Text",
+    "errorCategory": "Error Category",
+}
+
+
+@dataclass(slots=True)
+class ErrorEntry:
+    incorrect: str
+    correct: str
+    category: str
+
+    @classmethod
+    def from_record(cls, record):
+        values = {_KEY_ALIASES.get(key, key): value for key, value in record.items()}
+        return cls(*(_text(values.get(column)) for column in COLUMNS))
+
+    def to_record(self):
+        return {"Incorrect Text": self.incorrect, "Correct Text": self.correct, "Error Category": self.category}
+
+    def as_tuple(self):
+        return self.incorrect, self.correct, self.category
+
+
+class ErrorTable:
+    """Errors found on one page; serialises to the same records as the old DataFrame"""
+
+    __slots__ = ("entries",)
+
+    def __init__(self, entries=()):
+        self.entries = list(entries)
+
+    @classmethod
+    def from_llm_output(cls, errors):
+        """Normalise grammar-check output: a list of 3-item rows or raw "a -> b -> c" lines"""
+        if isinstance(errors, str):
+            errors = [line.split("->") for line in errors.splitlines() if "->" in line and len(line.split("->")) == 3]
+        if not isinstance(errors, list) or not all(isinstance(entry, (list, tuple)) and len(entry) == 3 for entry in errors):
+            return cls()
+        return cls(
+            ErrorEntry(
+                re.sub(r'^\d+\.\s*', '', incorrect),
+                correct,
+                'Spelling' if 'spell' in category.lower() else 'Grammar',
+            )
+            for incorrect, correct, category in errors
+        )
+
+    @classmethod
+    def from_records(cls, records):
+        """Build from JSON records with either "Incorrect Text" or "incorrectText" style keys"""
+        if not isinstance(records, list):
+            return cls()
+        return cls(ErrorEntry.from_record(record) for record in records if isinstance(record, dict))
+
+    def to_records(self):
+        return [entry.to_record() for entry in self.entries]
+
+    def rows(self):
+        """(incorrect, correct, category) tuples, as consumed by marking.find_error_spans"""
+        return [entry.as_tuple() for entry in self.entries]
+
+    @property
+    def empty(self):
+        return not self.entries
+
+    def __iter__(self):
+        return iter(self.entries)
+
+    def __len__(self):
+        return len(self.entries)
+
+
+def _text(value):
+    return value if isinstance(value, str) else ("" if value is None else str(value))
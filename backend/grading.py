@@ -0,0 +1,110 @@
+import os
+import queue
+from concurrent.futures import ThreadPoolExecutor
+
+from backend_handwriting import OCR_MODE, extract_and_check_image, extract_text_from_image
+from error_table import ErrorTable
+from grammar_check import check_grammar
+from marking import render_html, spans_from_offsets
+from observability import stage
+
+# Maximum number of pages of one upload that are graded at the same time
+UPLOAD_CONCURRENCY = int(os.environ.get("UPLOAD_CONCURRENCY", "4"))
+
+
+def grade_text(extracted_text, errors=None):
+    """Run the grammar check on extracted text and mark the errors in it.
+
+    errors, if given, are the combined-mode errors (dicts with offsets) and replace
+    the separate grammar check.
+    """
+    if errors is None:
+        errors = check_grammar(extracted_text)
+    with stage("marking"):
+        error_table = ErrorTable.from_llm_output([
+            [str(error.get("incorrect", "")), str(error.get("correct", "")), str(error.get("category", ""))]
+            for error in errors
+        ])
+        # Offsets are resolved once; markedText and the PDF report both render from errorSpans
+        spans = spans_from_offsets(extracted_text, [
+            (*entry.as_tuple(), error.get("start"), error.get("end"))
+            for entry, error in zip(error_table, errors)
+        ])
+        marked_text = render_html(extracted_text, spans)
+    return {
+        'extractedText': extracted_text,
+        'errorTable': error_table.to_records(),
+        'errorSpans': spans,
+        'markedText': marked_text,
+    }
+
+
+def grade_image(image_path, use_cache=True, on_text=None):
+    """OCR and grammar-check one image according to OCR_MODE.
+
+    on_text(extracted_text) is called as soon as the transcript is known, before
+    the grammar check in two-step mode.
+    """
+    if OCR_MODE == "combined":
+        combined = extract_and_check_image(image_path, use_cache=use_cache)
+        if combined is not None:
+            if on_text:
+                on_text(combined["text"])
+            return grade_text(combined["text"], errors=combined["errors"])
+    extracted_text = extract_text_from_image(image_path, use_cache=use_cache)
+    if on_text:
+        on_text(extracted_text)
+    return grade_text(extracted_text)
+
+
+def grade_page(image_path, image_name):
+    """OCR -> grammar -> marking for a single uploaded page"""
+    result = {'image': image_name}
+    result.update(grade_image(image_path))
+    return result
+
+
+def grade_pages(pages, concurrency=None):
+    """Grade (image_path, image_name) pairs in parallel, keeping page order"""
+    if not pages:
+        return []
+    workers = max(1, min(concurrency or UPLOAD_CONCURRENCY, len(pages)))
+    if workers == 1:
+        return [grade_page(path, name) for path, name in pages]
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grade") as executor:
+        return list(executor.map(lambda page: grade_page(*page), pages))
+
+
+def iter_graded_pages(pages, concurrency=None, use_cache=True):
+    """Grade pages in parallel, yielding (event, index, data) as each stage finishes.
+
+    Every page produces an "ocr" event with its extracted text, followed by either
+    a "page" event with the full result or an "error" event. Events arrive in
+    completion order; index is the page's position in the upload.
+    """
+    events = queue.Queue()
+
+    def run(index, image_path, image_name):
+        try:
+            def on_text(extracted_text):
+                events.put(("ocr", index, {'image': image_name, 'extractedText': extracted_text}))
+            result = {'image': image_name}
+            result.update(grade_image(image_path, use_cache=use_cache, on_text=on_text))
+            events.put(("page", index, result))
+        except Exception as e:
+            events.put(("error", index, {'image': image_name, 'error': str(e)}))
+
+    workers = max(1, min(concurrency or UPLOAD_CONCURRENCY, len(pages) or 1))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="grade-stream")
+    try:
+        for index, (image_path, image_name) in enumerate(pages):
+            executor.submit(run, index, image_path, image_name)
+        remaining = len(pages)
+        while remaining:
+            event = events.get()
+            if event[0] != "ocr":
+                remaining -= 1
+            yield event
+    finally:
+        # Runs when the client disconnects too: drop pages that have not started yet
+        executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,211 @@
+import logging
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from backend_handwriting import correct_spelling_grammar
+from disk_cache import DiskCache, content_key
+from error_table import ErrorTable
+from language_detection import LANGUAGE_CONFIDENCE_THRESHOLD, detect_language_offline
+from llm_client import LLM_MODEL
+from marking import _bounded
+from observability import stage
+from spelling import SPELLING_MODE, find_misspellings
+
+logger = logging.getLogger(__name__)
+
+# Sentences are checked in chunks of about this many characters (0 sends the whole text at once)
+GRAMMAR_CHUNK_CHARS = int(os.environ.get("GRAMMAR_CHUNK_CHARS", "600"))
+# Chunks of one text checked at once (per call; llm_client's limits bound the process)
+GRAMMAR_CONCURRENCY = int(os.environ.get("GRAMMAR_CONCURRENCY", "4"))
+# Bump whenever the grammar prompt or its parsing changes so cached sentences are re-checked
+GRAMMAR_PROMPT_VERSION = "1"
+
+grammar_cache = DiskCache(
+    "grammar",
+    max_entries=int(os.environ.get("GRAMMAR_CACHE_MAX_ENTRIES", "100000")),
+    max_bytes=int(os.environ.get("GRAMMAR_CACHE_MAX_MB", "64")) * 1024 * 1024,
+    max_age=int(os.environ.get("GRAMMAR_CACHE_MAX_AGE_DAYS", "30")) * 24 * 3600,
+)
+
+# A sentence ends at . ! or ? (plus closing quotes or brackets) before whitespace, or at a
+# blank line. Single newlines are line breaks of the handwriting, not sentence ends.
+_SENTENCE_END = re.compile(r"""[.!?]+["')\]”’]*(?=\s)|\n[ \t]*\n""")
+
+
+def split_sentences(text):
+    """(start, end) offsets of the sentences in text, without surrounding whitespace"""
+    spans, start = [], 0
+    for match in _SENTENCE_END.finditer(text):
+        spans.append((start, match.end()))
+        start = match.end()
+    spans.append((start, len(text)))
+
+    trimmed = []
+    for start, end in spans:
+        sentence = text[start:end]
+        if sentence.strip():
+            start += len(sentence) - len(sentence.lstrip())
+            end -= len(sentence) - len(sentence.rstrip())
+            trimmed.append((start, end))
+    return trimmed
+
+
+def normalize_sentence(sentence):
+    return " ".join(sentence.split())
+
+
+def _normalize_with_offsets(original):
+    """normalize_sentence(original) and, for each of its characters, the offset in original"""
+    parts, offsets = [], []
+    for match in re.finditer(r"\S+", original):
+        if parts:
+            # The collapsed run of whitespace maps to its first character
+            parts.append(" ")
+            offsets.append(offsets[-1] + 1)
+        parts.append(match.group())
+        offsets.extend(range(match.start(), match.end()))
+    return "".join(parts), offsets
+
+
+def _cache_key(sentence, grammar_only):
+    return content_key(sentence, LLM_MODEL, GRAMMAR_PROMPT_VERSION, "grammar" if grammar_only else "full")
+
+
+def _chunks(sentences):
+    """Group sentences into runs of about GRAMMAR_CHUNK_CHARS characters"""
+    if GRAMMAR_CHUNK_CHARS <= 0:
+        return [sentences] if sentences else []
+    chunks, current, size = [], [], 0
+    for sentence in sentences:
+        if current and size + len(sentence) > GRAMMAR_CHUNK_CHARS:
+            chunks.append(current)
+            current, size = [], 0
+        current.append(sentence)
+        size += len(sentence) + 1
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _check_chunk(sentences, grammar_only=False):
+    """One grammar call for a chunk.
+
+    Returns ({sentence: [(incorrect, correct, category), ...]}, unplaced, uncertain).
+    A row belongs to the one sentence containing its incorrect text as whole words.
+    Rows found in several sentences or in none (e.g. the model changed the quoted
+    text) are unplaced: they belong to this text only. uncertain are the sentences
+    such a row may have come from, whose rows must not be cached.
+    """
+    rows = ErrorTable.from_llm_output(correct_spelling_grammar(" ".join(sentences), grammar_only)).rows()
+    found = {sentence: [] for sentence in sentences}
+    unplaced, uncertain = [], set()
+    for row in rows:
+        pattern = re.compile(_bounded(row[0])) if row[0] else None
+        matches = [sentence for sentence in sentences if pattern and pattern.search(sentence)]
+        if len(matches) == 1:
+            found[matches[0]].append(row)
+            continue
+        unplaced.append(row)
+        uncertain.update(matches or sentences)
+    return found, unplaced, uncertain
+
+
+def _locate(sentence, offsets, base, incorrect, claimed):
+    """(start, end) in the original text of the first whole-word occurrence of incorrect
+    in the normalized sentence that no other error has claimed, or None"""
+    if not incorrect:
+        return None
+    for match in re.finditer(_bounded(incorrect), sentence):
+        first, last = base + offsets[match.start()], base + offsets[match.end() - 1] + 1
+        if not any(first < end and start < last for start, end in claimed):
+            claimed.append((first, last))
+            return first, last
+    return None
+
+
+def local_spelling_errors(text):
+    """Offline spelling errors of text, or None if SPELLING_MODE is off or no dictionary applies"""
+    if SPELLING_MODE == "off" or not text:
+        return None
+    language, confidence = detect_language_offline(text)
+    if confidence < LANGUAGE_CONFIDENCE_THRESHOLD:
+        return None
+    with stage("spelling_check"):
+        return find_misspellings(text, language)
+
+
+def check_grammar(text):
+    """Spelling and grammar errors of text as dicts with incorrect, correct, category, start, end.
+
+    Spelling is checked offline when a dictionary for the text's language is
+    installed; the LLM then only looks for grammar errors (SPELLING_MODE=hybrid)
+    or is not asked at all (local). start/end are offsets into text, or None where
+    the incorrect text could not be located.
+    """
+    spelling = local_spelling_errors(text)
+    if spelling is not None and SPELLING_MODE == "local":
+        return spelling
+    errors = _llm_errors(text, grammar_only=spelling is not None)
+    if not spelling:
+        return errors
+
+    # Local corrections win where the LLM reports the same word
+    words = {error["incorrect"] for error in spelling}
+    merged = spelling + [
+        error for error in errors
+        if error["incorrect"] not in words and not any(
+            error["start"] is not None and error["start"] < other["end"] and other["start"] < error["end"]
+            for other in spelling
+        )
+    ]
+    merged.sort(key=lambda error: (error["start"] is None, error["start"] or 0))
+    return merged
+
+
+def _llm_errors(text, grammar_only):
+    """LLM check of text per sentence: cached sentences are reused, the rest sent in concurrent chunks"""
+    spans = split_sentences(text or "")
+    # Rows quote the normalized sentences sent to the model; offsets map them back to text
+    normalized = [_normalize_with_offsets(text[start:end]) for start, end in spans]
+    sentences = [sentence for sentence, _ in normalized]
+
+    results, missing, unplaced = {}, [], []
+    for sentence in dict.fromkeys(sentences):
+        cached = grammar_cache.get(_cache_key(sentence, grammar_only))
+        if cached is not None:
+            results[sentence] = [tuple(row) for row in cached["errors"]]
+        else:
+            missing.append(sentence)
+
+    if missing:
+        logger.debug("Grammar check: %d of %d sentences not cached", len(missing), len(results) + len(missing))
+        chunks = _chunks(missing)
+        with ThreadPoolExecutor(max_workers=max(1, min(GRAMMAR_CONCURRENCY, len(chunks))),
+                                thread_name_prefix="grammar") as executor:
+            for found, rows_elsewhere, uncertain in executor.map(lambda chunk: _check_chunk(chunk, grammar_only), chunks):
+                for sentence, rows in found.items():
+                    if sentence not in uncertain:
+                        grammar_cache.set(_cache_key(sentence, grammar_only), {"errors": [list(row) for row in rows]})
+                    results[sentence] = rows
+                unplaced.extend(rows_elsewhere)
+
+    claimed, located = [], []
+    for (start, _), (sentence, offsets) in zip(spans, normalized):
+        located.extend((row, _locate(sentence, offsets, start, row[0], claimed)) for row in results[sentence])
+    if unplaced:
+        whole, offsets = _normalize_with_offsets(text)
+        located.extend((row, _locate(whole, offsets, 0, row[0], claimed)) for row in unplaced)
+
+    errors = []
+    for (incorrect, correct, category), span in located:
+        first, last = span or (None, None)
+        errors.append({
+            # Where the original breaks a line inside the quoted words, report the text as it stands there
+            "incorrect": text[first:last] if span else incorrect,
+            "correct": correct,
+            "category": category,
+            "start": first,
+            "end": last,
+        })
+    return errors
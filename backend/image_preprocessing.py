@@ -0,0 +1,152 @@
+import logging
+import mimetypes
+import os
+
+from lazy_imports import lazy_module
+
+cv2 = lazy_module("cv2")
+np = lazy_module("numpy")
+
+logger = logging.getLogger(__name__)
+
+# Preprocessing applied to page photos before they are sent to the vision model
+OCR_PREPROCESS = os.environ.get("OCR_PREPROCESS", "true").lower() in ("1", "true", "yes")
+OCR_MAX_LONG_EDGE = int(os.environ.get("OCR_MAX_LONG_EDGE", "2000"))
+OCR_JPEG_QUALITY = int(os.environ.get("OCR_JPEG_QUALITY", "85"))
+OCR_GRAYSCALE = os.environ.get("OCR_GRAYSCALE", "true").lower() in ("1", "true", "yes")
+OCR_MAX_DESKEW_ANGLE = float(os.environ.get("OCR_MAX_DESKEW_ANGLE", "5"))
+
+# Bump whenever the preprocessing algorithm changes so cached OCR results are redone
+PREPROCESS_VERSION = "2"
+
+# Formats the vision API accepts as-is when preprocessing is off or fails
+SUPPORTED_MIME_TYPES = {"image/jpeg", "image/png", "image/gif", "image/webp"}
+
+
+def preprocess_signature():
+    """Settings that change what the model sees; part of the OCR cache key"""
+    if not OCR_PREPROCESS:
+        return "raw"
+    return (f"v={PREPROCESS_VERSION};edge={OCR_MAX_LONG_EDGE};q={OCR_JPEG_QUALITY};gray={OCR_GRAYSCALE};"
+            f"deskew={OCR_MAX_DESKEW_ANGLE}")
+
+
+def guess_mime_type(filename, image_bytes=b""):
+    """MIME type from the file signature, falling back to the extension"""
+    if image_bytes.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if image_bytes.startswith(b"\x89PNG\r\n\x1a\n"):
+        return "image/png"
+    if image_bytes[:6] in (b"GIF87a", b"GIF89a"):
+        return "image/gif"
+    if image_bytes[:4] == b"RIFF" and image_bytes[8:12] == b"WEBP":
+        return "image/webp"
+    return mimetypes.guess_type(filename)[0] or "image/jpeg"
+
+
+def decode_image(image_bytes):
+    return cv2.imdecode(np.frombuffer(image_bytes, np.uint8), cv2.IMREAD_COLOR)
+
+
+def downscale(image, max_long_edge):
+    height, width = image.shape[:2]
+    long_edge = max(height, width)
+    if not max_long_edge or long_edge <= max_long_edge:
+        return image
+    scale = max_long_edge / long_edge
+    return cv2.resize(image, (round(width * scale), round(height * scale)), interpolation=cv2.INTER_AREA)
+
+
+def _ink_mask(gray):
+    """Binary mask of pen strokes; adaptive so shadows across a phone photo are not taken as ink"""
+    block = max(15, min(gray.shape[:2]) // 20) | 1
+    return cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, block, 15)
+
+
+def estimate_skew(gray, max_angle):
+    """Angle (degrees) that makes text lines horizontal, via projection-profile search.
+
+    Runs on a small binarised copy; the best angle maximises the variance of the
+    row sums, which peaks when lines of handwriting are level.
+    """
+    if max_angle <= 0:
+        return 0.0
+    mask = _ink_mask(downscale(gray, 600))
+    height, width = mask.shape
+    center = (width / 2, height / 2)
+    best_angle, best_score = 0.0, None
+    for angle in np.arange(-max_angle, max_angle + 0.01, 0.5):
+        matrix = cv2.getRotationMatrix2D(center, float(angle), 1.0)
+        rotated = cv2.warpAffine(mask, matrix, (width, height), flags=cv2.INTER_NEAREST)
+        score = float(np.var(rotated.sum(axis=1)))
+        if best_score is None or score > best_score:
+            best_angle, best_score = float(angle), score
+    return best_angle
+
+
+def rotate(image, angle):
+    height, width = image.shape[:2]
+    matrix = cv2.getRotationMatrix2D((width / 2, height / 2), angle, 1.0)
+    return cv2.warpAffine(image, matrix, (width, height), flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_REPLICATE)
+
+
+def content_box(gray, margin=0.02):
+    """Bounding box (x0, y0, x1, y1) of the ink, ignoring isolated specks"""
+    mask = cv2.morphologyEx(_ink_mask(gray), cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    points = cv2.findNonZero(mask)
+    if points is None:
+        return None
+    x, y, w, h = cv2.boundingRect(points)
+    height, width = gray.shape[:2]
+    pad_x, pad_y = int(width * margin), int(height * margin)
+    x0, y0 = max(0, x - pad_x), max(0, y - pad_y)
+    x1, y1 = min(width, x + w + pad_x), min(height, y + h + pad_y)
+    # A tiny box means the threshold picked up noise rather than the page text
+    if (x1 - x0) * (y1 - y0) < 0.2 * width * height:
+        return None
+    return x0, y0, x1, y1
+
+
+def prepare_image_for_ocr(image_bytes, filename=""):
+    """Return (payload_bytes, mime_type) to send to the vision model.
+
+    Downscales to OCR_MAX_LONG_EDGE, converts to grayscale, deskews, crops to the
+    written area and re-encodes as JPEG. Falls back to the original bytes when
+    preprocessing is disabled, fails, or would not make the payload smaller.
+    """
+    original_mime = guess_mime_type(filename, image_bytes)
+    if not OCR_PREPROCESS:
+        return image_bytes, original_mime
+    try:
+        image = decode_image(image_bytes)
+        if image is None:
+            raise ValueError("unsupported image format")
+        image = downscale(image, OCR_MAX_LONG_EDGE)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        angle = estimate_skew(gray, OCR_MAX_DESKEW_ANGLE)
+        if angle:
+            gray = rotate(gray, angle)
+            image = rotate(image, angle)
+        if OCR_GRAYSCALE:
+            image = gray
+        box = content_box(gray)
+        if box:
+            x0, y0, x1, y1 = box
+            image = image[y0:y1, x0:x1]
+        ok, encoded = cv2.imencode(".jpg", image, [cv2.IMWRITE_JPEG_QUALITY, OCR_JPEG_QUALITY])
+        if not ok:
+            raise ValueError("JPEG encoding failed")
+        payload = encoded.tobytes()
+    except Exception as e:
+        logger.warning("OCR preprocessing failed for %s: %s", os.path.basename(filename), e)
+        return image_bytes, original_mime
+
+    if len(payload) >= len(image_bytes) and original_mime in SUPPORTED_MIME_TYPES:
+        logger.debug("OCR preprocessing %s: kept original (%d bytes)", os.path.basename(filename), len(image_bytes))
+        return image_bytes, original_mime
+    saved = len(image_bytes) - len(payload)
+    logger.debug(
+        "OCR preprocessing %s: %d -> %d bytes (%d saved, %.0f%%), deskew %+.1f°", os.path.basename(filename),
+        len(image_bytes), len(payload), saved, 100 * saved / max(len(image_bytes), 1), angle,
+    )
+    return payload, "image/jpeg"
@@ -0,0 +1,248 @@
+import json
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from database import get_connection, init_schema, transaction
+
+logger = logging.getLogger(__name__)
+
+# Background grading workers per process, and pages graded in parallel inside one job
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "2"))
+JOB_PAGE_CONCURRENCY = int(os.environ.get("JOB_PAGE_CONCURRENCY", os.environ.get("UPLOAD_CONCURRENCY", "4")))
+# A running job whose heartbeat is older than this is assumed orphaned and re-queued
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", "300"))
+JOB_HEARTBEAT_SECONDS = 15
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    student_name TEXT,
+    student_class TEXT,
+    subject TEXT,
+    total_pages INTEGER NOT NULL,
+    done_pages INTEGER NOT NULL DEFAULT 0,
+    error TEXT,
+    worker TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    heartbeat REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_status_created ON jobs (status, created_at);
+CREATE INDEX IF NOT EXISTS idx_jobs_user ON jobs (user_id, created_at);
+
+CREATE TABLE IF NOT EXISTS job_pages (
+    job_id TEXT NOT NULL REFERENCES jobs (id),
+    page_index INTEGER NOT NULL,
+    image TEXT NOT NULL,
+    image_path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT,
+    error TEXT,
+    PRIMARY KEY (job_id, page_index)
+);
+"""
+
+QUEUED, RUNNING, COMPLETED, FAILED = "queued", "running", "completed", "failed"
+
+
+class JobQueue:
+    """Durable grading queue stored in SQLite and drained by background threads.
+
+    process_page(image_path, image_name) -> result dict is the per-page grading
+    chain. Finished pages are persisted as they complete, so a job interrupted by
+    a restart resumes with only its unfinished pages. on_complete(job) is called
+    once a job reaches a final state.
+    """
+
+    def __init__(self, process_page, workers=JOB_WORKERS, page_concurrency=JOB_PAGE_CONCURRENCY, on_complete=None):
+        self.process_page = process_page
+        self.workers = workers
+        self.page_concurrency = max(1, page_concurrency)
+        self.on_complete = on_complete
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._wakeup = threading.Event()
+        self._threads = []
+        init_schema(SCHEMA)
+
+    def start(self):
+        if self._threads:
+            return
+        self.requeue_stale(own=True)
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def enqueue(self, user_id, pages, student_name=None, student_class=None, subject=None):
+        """Persist a job for the given (image_path, image_name) pages and return its id"""
+        job_id = str(uuid.uuid4())
+        now = time.time()
+        with transaction() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, user_id, status, student_name, student_class, subject, total_pages,"
+                " created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (job_id, user_id, QUEUED, student_name, student_class, subject, len(pages), now, now),
+            )
+            conn.executemany(
+                "INSERT INTO job_pages (job_id, page_index, image, image_path, status) VALUES (?, ?, ?, ?, ?)",
+                [(job_id, i, name, path, QUEUED) for i, (path, name) in enumerate(pages)],
+            )
+        self._wakeup.set()
+        return job_id
+
+    def active_images(self):
+        """Image names of pages in queued or running jobs"""
+        rows = get_connection().execute(
+            "SELECT DISTINCT p.image FROM job_pages p JOIN jobs j ON j.id = p.job_id WHERE j.status IN (?, ?)",
+            (QUEUED, RUNNING),
+        )
+        return {row["image"] for row in rows}
+
+    def get(self, job_id, user_id=None):
+        """Job status with per-page progress, or None if it does not exist for this user"""
+        conn = get_connection()
+        job = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        if job is None or (user_id is not None and job["user_id"] != user_id):
+            return None
+        pages = conn.execute(
+            "SELECT page_index, image, status, result, error FROM job_pages WHERE job_id = ? ORDER BY page_index",
+            (job_id,),
+        ).fetchall()
+        return {
+            "jobId": job["id"],
+            "userId": job["user_id"],
+            "status": job["status"],
+            "studentName": job["student_name"],
+            "studentClass": job["student_class"],
+            "subject": job["subject"],
+            "totalPages": job["total_pages"],
+            "donePages": job["done_pages"],
+            "error": job["error"],
+            "createdAt": job["created_at"],
+            "updatedAt": job["updated_at"],
+            "pages": [
+                {
+                    "index": page["page_index"],
+                    "image": page["image"],
+                    "status": page["status"],
+                    "result": json.loads(page["result"]) if page["result"] else None,
+                    "error": page["error"],
+                }
+                for page in pages
+            ],
+        }
+
+    def requeue_stale(self, own=False):
+        """Put running jobs back in the queue if their worker stopped heartbeating.
+
+        own=True also takes back jobs claimed under this worker id, which only a
+        previous process with the same host and pid can hold (called at start()).
+        The periodic sweep leaves them alone: sibling threads may still run them.
+        """
+        now = time.time()
+        query = ("UPDATE jobs SET status = ?, worker = NULL, updated_at = ? WHERE status = ? AND"
+                 " (heartbeat IS NULL OR heartbeat < ?")
+        params = [QUEUED, now, RUNNING, now - JOB_STALE_SECONDS]
+        if own:
+            query += " OR worker = ?"
+            params.append(self.worker_id)
+        with transaction() as conn:
+            conn.execute(query + ")", params)
+
+    def _claim_next(self):
+        now = time.time()
+        with transaction() as conn:
+            row = conn.execute(
+                "SELECT id FROM jobs WHERE status = ? ORDER BY created_at LIMIT 1", (QUEUED,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE jobs SET status = ?, worker = ?, heartbeat = ?, updated_at = ? WHERE id = ?",
+                (RUNNING, self.worker_id, now, now, row["id"]),
+            )
+            return row["id"]
+
+    def _worker_loop(self):
+        last_stale_check = time.time()
+        while True:
+            try:
+                job_id = self._claim_next()
+                if job_id is not None:
+                    self._run(job_id)
+                    continue
+                if time.time() - last_stale_check > JOB_STALE_SECONDS:
+                    self.requeue_stale()
+                    last_stale_check = time.time()
+            except Exception as e:
+                logger.exception("Job worker error: %s", e)
+            self._wakeup.wait(timeout=5)
+            self._wakeup.clear()
+
+    def _heartbeat(self, job_id):
+        now = time.time()
+        get_connection().execute(
+            "UPDATE jobs SET heartbeat = ?, updated_at = ? WHERE id = ? AND worker = ?",
+            (now, now, job_id, self.worker_id),
+        )
+
+    def _run(self, job_id):
+        conn = get_connection()
+        pending = conn.execute(
+            "SELECT page_index, image, image_path FROM job_pages WHERE job_id = ? AND status != ? ORDER BY page_index",
+            (job_id, COMPLETED),
+        ).fetchall()
+        with ThreadPoolExecutor(max_workers=self.page_concurrency, thread_name_prefix=f"job-{job_id[:8]}") as executor:
+            futures = {
+                executor.submit(self.process_page, page["image_path"], page["image"]): page["page_index"]
+                for page in pending
+            }
+            while futures:
+                done, _ = wait(futures, timeout=JOB_HEARTBEAT_SECONDS, return_when=FIRST_COMPLETED)
+                for future in done:
+                    self._finish_page(job_id, futures.pop(future), future)
+                self._heartbeat(job_id)
+        self._finish_job(job_id)
+
+    def _finish_page(self, job_id, page_index, future):
+        try:
+            result, status, error = json.dumps(future.result()), COMPLETED, None
+        except Exception as e:
+            result, status, error = None, FAILED, str(e)
+        now = time.time()
+        with transaction() as conn:
+            conn.execute(
+                "UPDATE job_pages SET status = ?, result = ?, error = ? WHERE job_id = ? AND page_index = ?",
+                (status, result, error, job_id, page_index),
+            )
+            conn.execute(
+                "UPDATE jobs SET done_pages = (SELECT COUNT(*) FROM job_pages WHERE job_id = ? AND status != ?),"
+                " heartbeat = ?, updated_at = ? WHERE id = ?",
+                (job_id, QUEUED, now, now, job_id),
+            )
+
+    def _finish_job(self, job_id):
+        conn = get_connection()
+        failed = conn.execute(
+            "SELECT COUNT(*) FROM job_pages WHERE job_id = ? AND status = ?", (job_id, FAILED)
+        ).fetchone()[0]
+        total = conn.execute("SELECT total_pages FROM jobs WHERE id = ?", (job_id,)).fetchone()[0]
+        status = FAILED if failed == total else COMPLETED
+        error = f"{failed} of {total} pages failed" if failed else None
+        now = time.time()
+        conn.execute(
+            "UPDATE jobs SET status = ?, error = ?, heartbeat = NULL, updated_at = ? WHERE id = ?",
+            (status, error, now, job_id),
+        )
+        if self.on_complete:
+            try:
+                self.on_complete(self.get(job_id))
+            except Exception as e:
+                logger.exception("Job completion hook failed for %s: %s", job_id, e)
@@ -0,0 +1,101 @@
+import hashlib
+import os
+import re
+import threading
+from collections import Counter, OrderedDict
+
+from observability import CACHE_LOOKUPS, stage
+
+SAMPLES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "language_samples")
+LANGUAGES = ("english", "german")
+
+# Below this confidence the caller's fallback (the LLM) decides
+LANGUAGE_CONFIDENCE_THRESHOLD = float(os.environ.get("LANGUAGE_CONFIDENCE_THRESHOLD", "0.1"))
+PROFILE_SIZE = 400
+MAX_NGRAM = 3
+
+_profiles = None
+_profiles_lock = threading.Lock()
+_memo = OrderedDict()
+_memo_lock = threading.Lock()
+_MEMO_SIZE = 1024
+
+
+def _ngrams(text):
+    """Character 1..3-grams of each word, padded with spaces (Cavnar & Trenkle)"""
+    counts = Counter()
+    for word in re.findall(r"[^\W\d_]+", text.lower()):
+        padded = f" {word} "
+        for n in range(1, MAX_NGRAM + 1):
+            for i in range(len(padded) - n + 1):
+                gram = padded[i:i + n]
+                if gram != " ":
+                    counts[gram] += 1
+    return counts
+
+
+def _ranked(counts, size=PROFILE_SIZE):
+    return {gram: rank for rank, (gram, _) in enumerate(counts.most_common(size))}
+
+
+def load_profiles():
+    """Rank profiles built once from the bundled language_samples/<language>.txt files"""
+    global _profiles
+    with _profiles_lock:
+        if _profiles is None:
+            profiles = {}
+            for language in LANGUAGES:
+                with open(os.path.join(SAMPLES_DIR, f"{language}.txt"), encoding="utf-8") as fh:
+                    profiles[language] = _ranked(_ngrams(fh.read()))
+            _profiles = profiles
+        return _profiles
+
+
+def _classify(text):
+    document = _ranked(_ngrams(text))
+    if not document:
+        return "english", 0.0
+    distances = {}
+    for language, profile in load_profiles().items():
+        # Out-of-place measure: n-grams missing from a profile cost the maximum
+        distances[language] = sum(abs(rank - profile.get(gram, PROFILE_SIZE)) for gram, rank in document.items())
+    ranked = sorted(distances, key=distances.get)
+    best, runner_up = ranked[0], ranked[1]
+    confidence = (distances[runner_up] - distances[best]) / max(distances[runner_up], 1)
+    # Very short texts carry little evidence regardless of the margin
+    confidence *= min(1.0, len(document) / 60)
+    return best, round(confidence, 3)
+
+
+def detect_language_offline(text):
+    """(language, confidence) from the bundled n-gram profiles; confidence is in [0, 1]"""
+    return _classify(text or "")
+
+
+def detect_language(text, fallback=None, threshold=None):
+    """'english' or 'german', memoised per text hash.
+
+    The offline profiles decide unless their confidence is below threshold
+    (LANGUAGE_CONFIDENCE_THRESHOLD by default), in which case fallback(text) is
+    asked, if given. The final answer is memoised, so repeated calls for the same
+    text within and across requests cost a hash lookup.
+    """
+    threshold = LANGUAGE_CONFIDENCE_THRESHOLD if threshold is None else threshold
+    digest = hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+    with _memo_lock:
+        if digest in _memo:
+            _memo.move_to_end(digest)
+            CACHE_LOOKUPS.inc(cache="language", result="hit")
+            return _memo[digest]
+    CACHE_LOOKUPS.inc(cache="language", result="miss")
+
+    with stage("language_detection"):
+        language, confidence = detect_language_offline(text)
+        if confidence < threshold and fallback is not None:
+            language = fallback(text)
+
+    with _memo_lock:
+        _memo[digest] = language
+        while len(_memo) > _MEMO_SIZE:
+            _memo.popitem(last=False)
+    return language
@@ -0,0 +1,59 @@
+"""Heavy third-party modules imported on first use instead of at startup.
+
+    cv2 = lazy_module("cv2")        # nothing imported yet
+    cv2.imdecode(...)               # imports cv2, then behaves like the module
+
+preload() imports every module registered this way, for servers that import the
+app once and fork workers, or to warm a fresh process before it takes traffic.
+"""
+import importlib
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+_registry = {}
+
+
+class LazyModule:
+    """Stand-in for a module that imports it on the first attribute access"""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+
+    def _load(self):
+        module = self._module
+        if module is None:
+            # The import system's module locks make concurrent first uses safe
+            module = self._module = importlib.import_module(self._name)
+        return module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<lazy module {self._name!r} ({state})>"
+
+
+def lazy_module(name):
+    """The LazyModule for name (one per name, so preload() sees every heavy dependency)"""
+    if name not in _registry:
+        _registry[name] = LazyModule(name)
+    return _registry[name]
+
+
+def preload(*hooks):
+    """Import every registered module, then run hooks (e.g. template compilation); returns seconds spent"""
+    started = time.perf_counter()
+    for name, module in list(_registry.items()):
+        try:
+            module._load()
+        except ImportError as e:
+            logger.warning("Preloading %s failed: %s", name, e)
+    for hook in hooks:
+        hook()
+    elapsed = time.perf_counter() - started
+    logger.info("Preloaded %d modules in %.2fs", len(_registry), elapsed)
+    return elapsed
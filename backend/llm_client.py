@@ -0,0 +1,241 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+
+from dotenv import load_dotenv
+
+from lazy_imports import lazy_module
+from observability import LLM_IN_FLIGHT, LLM_REQUESTS, LLM_TOKENS, LLM_WAIT_SECONDS
+from rate_limit import TokenBucket
+
+# openai takes about a second to import; it is loaded with the first client
+httpx = lazy_module("httpx")
+openai = lazy_module("openai")
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+API_KEY = os.environ.get("OPENAI_API_KEY", "not-set")
+# Main model for OCR, grammar checks and suggestions; the fast model answers small
+# classification prompts such as the language detection fallback
+LLM_MODEL = os.environ.get("LLM_MODEL", "gpt-4o")
+LLM_FAST_MODEL = os.environ.get("LLM_FAST_MODEL", "gpt-3.5-turbo")
+
+# HTTP connection pool shared by every call (keep-alive avoids a TLS handshake per page)
+LLM_MAX_CONNECTIONS = int(os.environ.get("LLM_MAX_CONNECTIONS", "32"))
+LLM_TIMEOUT = float(os.environ.get("LLM_TIMEOUT", "120"))
+# Requests in flight at once across all threads
+LLM_MAX_CONCURRENCY = int(os.environ.get("LLM_MAX_CONCURRENCY", "16"))
+# Requests in flight at once on the shared event loop used by achat_completion
+LLM_ASYNC_CONCURRENCY = int(os.environ.get("LLM_ASYNC_CONCURRENCY", "64"))
+# Retries for 408/409/429/5xx and connection errors, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", "5"))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", "30"))
+# Account quota; 0 disables the corresponding limit
+LLM_RPM = int(os.environ.get("LLM_RPM", "0"))
+LLM_TPM = int(os.environ.get("LLM_TPM", "0"))
+
+# Rough prompt cost of one image and of an answer without max_tokens, for the TPM budget
+IMAGE_TOKEN_ESTIMATE = 1000
+DEFAULT_COMPLETION_ESTIMATE = 1000
+RETRYABLE_STATUS = {408, 409, 429}
+
+_client = None
+_client_lock = threading.Lock()
+
+request_bucket = TokenBucket(LLM_RPM)
+token_bucket = TokenBucket(LLM_TPM)
+_in_flight = threading.BoundedSemaphore(LLM_MAX_CONCURRENCY)
+
+# Async calls from any thread or event loop run on one background loop, so they share
+# a single connection pool and LLM_ASYNC_CONCURRENCY however requests are served
+_async_loop = None
+_async_lock = threading.Lock()
+async_client = None
+_async_in_flight = None
+
+
+def estimate_tokens(messages, max_tokens=None):
+    """Upper-bound guess of prompt + completion tokens (about 4 characters per token)"""
+    prompt = 0
+    for message in messages:
+        content = message.get("content")
+        parts = content if isinstance(content, list) else [{"type": "text", "text": content or ""}]
+        for part in parts:
+            if part.get("type") == "image_url":
+                prompt += IMAGE_TOKEN_ESTIMATE
+            else:
+                prompt += len(part.get("text") or "") // 4 + 1
+    return prompt + (max_tokens or DEFAULT_COMPLETION_ESTIMATE)
+
+
+def _retryable(error):
+    if isinstance(error, (openai.APIConnectionError, openai.APITimeoutError)):
+        return True
+    return isinstance(error, openai.APIStatusError) and (
+        error.status_code in RETRYABLE_STATUS or error.status_code >= 500
+    )
+
+
+def _retry_after(error):
+    """Seconds the server asked us to wait, if it said so"""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    try:
+        return float(response.headers.get("retry-after-ms")) / 1000
+    except (TypeError, ValueError):
+        pass
+    try:
+        return float(response.headers.get("retry-after"))
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(attempt, retry_after=None):
+    """Full jitter: uniform in [0, min(max, base * 2**attempt)], but never below Retry-After"""
+    delay = random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, LLM_BACKOFF_MAX))
+    return delay
+
+
+def get_client():
+    """The shared OpenAI client, built on first use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                http_client = httpx.Client(
+                    limits=httpx.Limits(
+                        max_connections=LLM_MAX_CONNECTIONS,
+                        max_keepalive_connections=LLM_MAX_CONNECTIONS,
+                        keepalive_expiry=60,
+                    ),
+                    timeout=httpx.Timeout(LLM_TIMEOUT, connect=10),
+                )
+                # Retries are ours (rate-limit aware), so the SDK's own are switched off
+                _client = openai.OpenAI(api_key=API_KEY, http_client=http_client, max_retries=0)
+    return _client
+
+
+def _record_usage(response, model, estimate):
+    LLM_REQUESTS.inc(model=model, outcome="ok")
+    usage = getattr(response, "usage", None)
+    if usage is not None and usage.total_tokens:
+        token_bucket.adjust(estimate - usage.total_tokens)
+        LLM_TOKENS.inc(usage.prompt_tokens or 0, model=model, kind="prompt")
+        LLM_TOKENS.inc(usage.completion_tokens or 0, model=model, kind="completion")
+
+
+def _retry_delay(error, model, attempt):
+    """Seconds to wait before retrying after error, or None if the error is final"""
+    if not _retryable(error) or attempt >= LLM_MAX_RETRIES:
+        LLM_REQUESTS.inc(model=model, outcome="error")
+        return None
+    LLM_REQUESTS.inc(model=model, outcome="retry")
+    delay = backoff_delay(attempt, _retry_after(error))
+    if getattr(error, "status_code", None) == 429:
+        # Hold back every caller, not just this one, until the quota recovers
+        request_bucket.drain(delay)
+    logger.warning("LLM call failed (%s), retry %d/%d in %.1fs", type(error).__name__, attempt + 1, LLM_MAX_RETRIES, delay)
+    return delay
+
+
+def chat_completion(messages, model=None, **kwargs):
+    """get_client().chat.completions.create through the shared pool, rate limits and retries.
+
+    Waits for a request slot and for the estimated tokens before each attempt and
+    settles the token budget with the real usage afterwards. Raises the last error
+    once retries are exhausted or the error is not retryable.
+    """
+    model = model or LLM_MODEL
+    estimate = estimate_tokens(messages, kwargs.get("max_tokens"))
+    attempt = 0
+    while True:
+        LLM_WAIT_SECONDS.observe(request_bucket.acquire() + token_bucket.acquire(estimate))
+        try:
+            with _in_flight, LLM_IN_FLIGHT.track():
+                response = get_client().chat.completions.create(model=model, messages=messages, **kwargs)
+        except openai.OpenAIError as e:
+            token_bucket.adjust(estimate)
+            delay = _retry_delay(e, model, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+            continue
+
+        _record_usage(response, model, estimate)
+        return response
+
+
+def _shared_loop():
+    """The background event loop (and its AsyncOpenAI client), started on first use"""
+    global _async_loop, async_client, _async_in_flight
+    with _async_lock:
+        if _async_loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="llm-async", daemon=True).start()
+            connections = max(LLM_MAX_CONNECTIONS, LLM_ASYNC_CONCURRENCY)
+            async_client = openai.AsyncOpenAI(
+                api_key=API_KEY,
+                http_client=httpx.AsyncClient(
+                    limits=httpx.Limits(max_connections=connections, max_keepalive_connections=connections,
+                                        keepalive_expiry=60),
+                    timeout=httpx.Timeout(LLM_TIMEOUT, connect=10),
+                ),
+                max_retries=0,
+            )
+            _async_in_flight = asyncio.Semaphore(LLM_ASYNC_CONCURRENCY)
+            _async_loop = loop
+        return _async_loop
+
+
+async def _wait_for(bucket, amount):
+    waited = 0.0
+    while (delay := bucket.try_acquire(amount)) > 0:
+        await asyncio.sleep(delay)
+        waited += delay
+    return waited
+
+
+async def _achat_completion(messages, model, kwargs):
+    estimate = estimate_tokens(messages, kwargs.get("max_tokens"))
+    attempt = 0
+    while True:
+        LLM_WAIT_SECONDS.observe(await _wait_for(request_bucket, 1) + await _wait_for(token_bucket, estimate))
+        try:
+            async with _async_in_flight:
+                with LLM_IN_FLIGHT.track():
+                    response = await async_client.chat.completions.create(model=model, messages=messages, **kwargs)
+        except openai.OpenAIError as e:
+            token_bucket.adjust(estimate)
+            delay = _retry_delay(e, model, attempt)
+            if delay is None:
+                raise
+            await asyncio.sleep(delay)
+            attempt += 1
+            continue
+
+        _record_usage(response, model, estimate)
+        return response
+
+
+async def achat_completion(messages, model=None, **kwargs):
+    """Awaitable chat_completion with the same rate limits, retries and metrics.
+
+    The call runs on the shared background loop, so it can be awaited from any
+    event loop (e.g. an async Flask view's per-request loop) while one thread
+    multiplexes every async call of the process.
+    """
+    loop = _shared_loop()
+    coroutine = _achat_completion(messages, model or LLM_MODEL, kwargs)
+    if asyncio.get_running_loop() is loop:
+        return await coroutine
+    return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coroutine, loop))
@@ -0,0 +1,135 @@
+import html
+import re
+
+SPELLING_STYLE = "color:red;"
+GRAMMAR_STYLE = "color:blue;"
+
+
+def _bounded(incorrect):
+    """Regex for one incorrect string that will not match inside a longer word"""
+    pattern = re.escape(incorrect)
+    if re.match(r"\w", incorrect):
+        pattern = r"(?<!\w)" + pattern
+    if re.search(r"\w$", incorrect):
+        pattern += r"(?!\w)"
+    return pattern
+
+
+def find_error_spans(text, corrections):
+    """Resolve (incorrect, correct, category) corrections to character offsets.
+
+    All incorrect strings are compiled into one alternation (longest first) and
+    matched in a single left-to-right pass over the text. Each correction claims
+    one occurrence, so a word listed once is highlighted once, and spans never
+    overlap. Corrections whose text only occurs inside a longer word fall back
+    to a plain substring search. Returns span dicts sorted by start offset.
+    """
+    wanted = {}
+    for incorrect, correct, category in corrections:
+        incorrect = incorrect.strip() if isinstance(incorrect, str) else ""
+        if incorrect:
+            wanted.setdefault(incorrect, []).append((correct, category if isinstance(category, str) else ""))
+    if not text or not wanted:
+        return []
+
+    spans = []
+    regex = re.compile("|".join(_bounded(incorrect) for incorrect in sorted(wanted, key=len, reverse=True)))
+    for match in regex.finditer(text):
+        pending = wanted.get(match.group(0))
+        if pending:
+            correct, category = pending.pop(0)
+            spans.append(_span(match.start(), match.end(), match.group(0), correct, category))
+
+    for incorrect, pending in wanted.items():
+        position = 0
+        while pending:
+            start = text.find(incorrect, position)
+            if start < 0:
+                break
+            end = start + len(incorrect)
+            position = start + 1
+            if any(start < span["end"] and span["start"] < end for span in spans):
+                continue
+            correct, category = pending.pop(0)
+            spans.append(_span(start, end, incorrect, correct, category))
+
+    spans.sort(key=lambda span: span["start"])
+    return spans
+
+
+def spans_from_offsets(text, errors):
+    """Spans from (incorrect, correct, category, start, end) entries with model-reported offsets.
+
+    Offsets are trusted only where they point at the incorrect text and do not
+    overlap an earlier span; the remaining entries are located by find_error_spans.
+    """
+    spans, unresolved = [], []
+    for incorrect, correct, category, start, end in errors:
+        valid = (
+            isinstance(start, int) and isinstance(end, int) and 0 <= start < end <= len(text)
+            and text[start:end] == incorrect
+            and not any(start < span["end"] and span["start"] < end for span in spans)
+        )
+        if valid:
+            spans.append(_span(start, end, incorrect, correct, category))
+        else:
+            unresolved.append((incorrect, correct, category))
+
+    for span in find_error_spans(text, unresolved):
+        if not any(span["start"] < other["end"] and other["start"] < span["end"] for other in spans):
+            spans.append(span)
+    spans.sort(key=lambda span: span["start"])
+    return spans
+
+
+def _span(start, end, incorrect, correct, category):
+    return {"start": start, "end": end, "incorrect": incorrect, "correct": correct, "category": category}
+
+
+def spans_match_text(text, spans):
+    """True if spans are usable as-is: sorted, non-overlapping int offsets, each still at its incorrect text.
+
+    Spans sent back by clients go through here before rendering; anything else
+    (edited text, bad types, overlaps) is resolved again with find_error_spans.
+    """
+    if not isinstance(spans, list):
+        return False
+    position = 0
+    for span in spans:
+        if not isinstance(span, dict):
+            return False
+        start, end = span.get("start"), span.get("end")
+        if type(start) is not int or type(end) is not int or not position <= start <= end <= len(text):
+            return False
+        if text[start:end] != span.get("incorrect") or not isinstance(span.get("category") or "", str):
+            return False
+        position = end
+    return True
+
+
+def _render(text, spans, wrap):
+    out, position = [], 0
+    for span in spans:
+        out.append(html.escape(text[position:span["start"]], quote=False))
+        out.append(wrap(html.escape(text[span["start"]:span["end"]], quote=False), span["category"] or ""))
+        position = span["end"]
+    out.append(html.escape(text[position:], quote=False))
+    return "".join(out)
+
+
+def render_html(text, spans):
+    """Colour spelling errors red and grammar errors blue"""
+    def wrap(fragment, category):
+        if "Spelling" in category:
+            return f'<span style="{SPELLING_STYLE}">{fragment}</span>'
+        if "Grammar" in category:
+            return f'<span style="{GRAMMAR_STYLE}">{fragment}</span>'
+        return fragment
+    return _render(text, spans, wrap)
+
+
+def render_superscripts(text, spans):
+    """Append an S (spelling) or G (grammar) superscript after each error, for the PDF report"""
+    def wrap(fragment, category):
+        return f"{fragment}<sup>{'S' if 'Spelling' in category else 'G'}</sup>"
+    return _render(text, spans, wrap)
@@ -0,0 +1,193 @@
+import bisect
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# DEBUG also logs LLM answers and per-stage timings; WARNING keeps production logs quiet
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "INFO").upper()
+
+# If set, /metrics requires "Authorization: Bearer <METRICS_TOKEN>"
+METRICS_TOKEN = os.environ.get("METRICS_TOKEN", "")
+
+# Seconds; covers image encoding (ms) up to slow multi-page vision calls
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80)
+
+logger = logging.getLogger("smartmarks.stages")
+
+
+def configure_logging(level=None):
+    """Leveled logging for the backend modules (LOG_LEVEL, default INFO)"""
+    logging.basicConfig(
+        level=level or LOG_LEVEL,
+        format="%(asctime)s %(levelname)s %(name)s: %(message)s",
+    )
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    type = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.extend(self._samples(key, value))
+        return lines
+
+    def _samples(self, key, value):
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    type = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    @contextmanager
+    def track(self, **labels):
+        """Count the wrapped block as in progress"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+
+class Histogram(_Metric):
+    type = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, documentation, labelnames)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key, ((0,) * (len(self.buckets) + 1), 0.0))
+            counts = counts[:index] + (counts[index] + 1,) + counts[index + 1:]
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def _samples(self, key, value):
+        counts, total = value
+        lines, cumulative = [], 0
+        for bound, count in zip(self.buckets + (float("inf"),), counts):
+            cumulative += count
+            labels = _format_labels(self.labelnames, key, [("le", _format_value(float(bound)))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = _format_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"metric {metric.name} registered twice")
+            self._metrics[metric.name] = metric
+
+    def render(self):
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = Histogram(
+    "smartmarks_stage_seconds", "Time spent in each processing stage", ["stage"],
+)
+HTTP_REQUEST_SECONDS = Histogram(
+    "smartmarks_http_request_seconds", "HTTP request latency until the response is returned",
+    ["endpoint", "method", "status"],
+)
+HTTP_IN_FLIGHT = Gauge("smartmarks_http_requests_in_flight", "HTTP requests being handled", ["endpoint"])
+LLM_REQUESTS = Counter("smartmarks_llm_requests_total", "LLM API calls by outcome", ["model", "outcome"])
+LLM_TOKENS = Counter("smartmarks_llm_tokens_total", "LLM tokens reported by the API", ["model", "kind"])
+LLM_IN_FLIGHT = Gauge("smartmarks_llm_requests_in_flight", "LLM API calls waiting for an answer", [])
+LLM_WAIT_SECONDS = Histogram(
+    "smartmarks_llm_rate_limit_wait_seconds", "Time LLM calls waited for the rate limiter", [],
+)
+CACHE_LOOKUPS = Counter("smartmarks_cache_lookups_total", "Cache lookups by cache and result", ["cache", "result"])
+
+
+@contextmanager
+def stage(name):
+    """Time a processing stage into smartmarks_stage_seconds (and the DEBUG log)"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        logger.debug("stage %s took %.1f ms", name, elapsed * 1000)
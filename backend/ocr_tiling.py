@@ -0,0 +1,161 @@
+import difflib
+import math
+import os
+import re
+
+from image_preprocessing import OCR_GRAYSCALE, OCR_JPEG_QUALITY, _ink_mask, decode_image
+from lazy_imports import lazy_module
+
+cv2 = lazy_module("cv2")
+np = lazy_module("numpy")
+
+# "auto" tiles pages with more than OCR_TILE_MIN_LINES lines of writing, "always"
+# tiles every multi-line page, "off" sends the page as one image
+OCR_TILING = os.environ.get("OCR_TILING", "auto").lower()
+OCR_TILE_MIN_LINES = int(os.environ.get("OCR_TILE_MIN_LINES", "18"))
+OCR_TILE_MAX_LINES = int(os.environ.get("OCR_TILE_MAX_LINES", "10"))
+# Strips overlap by this fraction of the typical line pitch, so a line cut at a boundary is seen whole once
+OCR_TILE_OVERLAP = float(os.environ.get("OCR_TILE_OVERLAP", "0.5"))
+# Strips of one page OCRed at once (per page, not per process)
+OCR_TILE_CONCURRENCY = int(os.environ.get("OCR_TILE_CONCURRENCY", "4"))
+# Answer budget: tokens per detected line plus slack, clamped to [minimum, OCR_MAX_TOKENS]
+OCR_TOKENS_PER_LINE = int(os.environ.get("OCR_TOKENS_PER_LINE", "40"))
+OCR_MAX_TOKENS = int(os.environ.get("OCR_MAX_TOKENS", "4000"))
+PAGE_MIN_TOKENS = 500
+TILE_MIN_TOKENS = 200
+
+# Words compared at each seam when stitching strip transcripts
+SEAM_WORDS = 40
+
+
+def tiling_signature():
+    """Settings that change what the model sees or may answer; part of the OCR cache key"""
+    return (f"tiling={OCR_TILING};min={OCR_TILE_MIN_LINES};max={OCR_TILE_MAX_LINES};"
+            f"overlap={OCR_TILE_OVERLAP};tpl={OCR_TOKENS_PER_LINE};cap={OCR_MAX_TOKENS}")
+
+
+def token_budget(lines, minimum):
+    return max(minimum, min(OCR_MAX_TOKENS, lines * OCR_TOKENS_PER_LINE + 100))
+
+
+def find_text_lines(gray):
+    """(top, bottom) row ranges of the lines of writing, from the ink row profile"""
+    mask = cv2.morphologyEx(_ink_mask(gray), cv2.MORPH_OPEN, np.ones((3, 3), np.uint8))
+    height, width = mask.shape
+    profile = mask.sum(axis=1) / 255.0 / width
+    window = max(3, height // 300)
+    profile = np.convolve(profile, np.ones(window) / window, mode="same")
+    busy = profile[profile > 0]
+    if busy.size == 0:
+        return []
+    threshold = max(0.005, 0.2 * float(np.percentile(busy, 90)))
+    rows = profile > threshold
+
+    runs, start = [], None
+    for y, is_text in enumerate(rows):
+        if is_text and start is None:
+            start = y
+        elif not is_text and start is not None:
+            runs.append([start, y])
+            start = None
+    if start is not None:
+        runs.append([start, height])
+    if not runs:
+        return []
+
+    # Join fragments of one line (e.g. a gap between ascenders and the body) and drop specks
+    typical = float(np.median([bottom - top for top, bottom in runs]))
+    merged = [runs[0]]
+    for top, bottom in runs[1:]:
+        if top - merged[-1][1] < 0.3 * typical:
+            merged[-1][1] = bottom
+        else:
+            merged.append([top, bottom])
+    return [(top, bottom) for top, bottom in merged if bottom - top >= 0.3 * typical]
+
+
+def plan_strips(lines, height):
+    """Row ranges of overlapping strips, cut in the gaps between groups of lines"""
+    groups = [group.tolist() for group in np.array_split(np.arange(len(lines)), math.ceil(len(lines) / OCR_TILE_MAX_LINES))]
+    pitches = [lines[i + 1][0] - lines[i][0] for i in range(len(lines) - 1)]
+    overlap = int(OCR_TILE_OVERLAP * (float(np.median(pitches)) if pitches else 0))
+    cuts = [0]
+    for previous, following in zip(groups, groups[1:]):
+        cuts.append((lines[previous[-1]][1] + lines[following[0]][0]) // 2)
+    cuts.append(height)
+    strips = []
+    for i, group in enumerate(groups):
+        strips.append((max(0, cuts[i] - overlap), min(height, cuts[i + 1] + overlap), len(group)))
+    return strips
+
+
+def plan_ocr_images(payload, mime_type):
+    """[(image_bytes, mime_type, max_tokens), ...] to OCR for one preprocessed page.
+
+    A single entry means the page is sent whole; several entries are horizontal
+    strips in reading order whose transcripts are joined with merge_transcripts.
+    """
+    try:
+        image = decode_image(payload)
+    except Exception:
+        image = None
+    if image is None:
+        return [(payload, mime_type, PAGE_MIN_TOKENS)]
+
+    gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    lines = find_text_lines(gray)
+    single = [(payload, mime_type, token_budget(len(lines), PAGE_MIN_TOKENS))]
+    if (OCR_TILING == "off" or len(lines) <= OCR_TILE_MAX_LINES
+            or (OCR_TILING == "auto" and len(lines) <= OCR_TILE_MIN_LINES)):
+        return single
+
+    source = gray if OCR_GRAYSCALE else image
+    tiles = []
+    for top, bottom, line_count in plan_strips(lines, gray.shape[0]):
+        ok, encoded = cv2.imencode(".jpg", source[top:bottom], [cv2.IMWRITE_JPEG_QUALITY, OCR_JPEG_QUALITY])
+        if not ok:
+            return single
+        tiles.append((encoded.tobytes(), "image/jpeg", token_budget(line_count, TILE_MIN_TOKENS)))
+    return tiles
+
+
+def _normalise(token):
+    return re.sub(r"[^\w]", "", token.lower())
+
+
+def merge_transcripts(parts):
+    """Join strip transcripts in order, dropping text repeated across a seam.
+
+    Each seam compares the last words of the text so far with the first words of
+    the next strip; a run of at least three matching words that ends near the
+    former and starts near the latter is kept once.
+    """
+    merged = ""
+    for part in parts:
+        part = (part or "").strip()
+        if not part:
+            continue
+        if not merged:
+            merged = part
+            continue
+        left = re.findall(r"\S+\s*", merged)
+        right = re.findall(r"\S+\s*", part)
+        tail, head = left[-SEAM_WORDS:], right[:SEAM_WORDS]
+        matcher = difflib.SequenceMatcher(None, [_normalise(t) for t in tail], [_normalise(t) for t in head],
+                                          autojunk=False)
+        match = matcher.find_longest_match(0, len(tail), 0, len(head))
+        near_end = match.a + match.size >= len(tail) - 3
+        near_start = match.b <= 3
+        if match.size >= 3 and near_end and near_start:
+            keep_left = len(left) - len(tail) + match.a + match.size
+            keep_right = match.b + match.size
+            merged = "".join(left[:keep_left]).rstrip() + _separator(right[keep_right - 1]) + "".join(right[keep_right:])
+        else:
+            merged = merged.rstrip() + "\n" + part
+    return merged.strip()
+
+
+def _separator(token):
+    """Whitespace after the last repeated word in the next strip (a newline if its line ended there)"""
+    trailing = token[len(token.rstrip()):]
+    return "\n" if "\n" in trailing else " "
@@ -0,0 +1,282 @@
+import json
+import os
+import threading
+from functools import cache
+
+from disk_cache import content_key
+from error_table import ErrorTable
+from lazy_imports import lazy_module
+from marking import find_error_spans, spans_match_text
+from observability import CACHE_LOOKUPS
+from report_templates import TEMPLATE_VERSION, improvements_report_html
+
+fpdf = lazy_module("fpdf")
+pdfkit = lazy_module("pdfkit")
+Image = lazy_module("PIL.Image")
+
+# "fpdf" renders in-process; "pdfkit" keeps the wkhtmltopdf HTML path
+PDF_ENGINE = os.environ.get("PDF_ENGINE", "fpdf").lower()
+
+PDFKIT_OPTIONS = {"enable-local-file-access": ""}
+
+FONT = "Helvetica"
+PAGE_WIDTH = 190  # A4 width minus 10 mm margins
+MAX_IMAGE_HEIGHT = 105  # roughly the 400px cap of the HTML report
+LINE_HEIGHT = 6
+
+RED = (200, 0, 0)
+GREEN = (0, 128, 0)
+BLUE = (0, 0, 200)
+TEXT = (68, 68, 68)
+HEADING = (51, 51, 51)
+
+# Core PDF fonts are Latin-1 only; map the common typographic characters first
+_REPLACEMENTS = str.maketrans({
+    "→": "->", "–": "-", "—": "-", "‘": "'", "’": "'",
+    "“": '"', "„": '"', "”": '"', "…": "...", "•": "-",
+})
+
+
+def latin1(text):
+    if text is None:
+        return ""
+    return str(text).translate(_REPLACEMENTS).encode("latin-1", "replace").decode("latin-1")
+
+
+class ReportLayout:
+    """Report building blocks; combined with fpdf.FPDF by new_report() so fpdf loads with the first report"""
+
+    def __init__(self):
+        super().__init__(orientation="P", unit="mm", format="A4")
+        self.set_margins(10, 10, 10)
+        self.set_auto_page_break(True, margin=15)
+        self.add_page()
+
+    def heading(self, text, size=14, align="L"):
+        self.set_font(FONT, "B", size)
+        self.set_text_color(*HEADING)
+        self.ln(2)
+        self.multi_cell(0, size * 0.5, latin1(text), align=align)
+        self.ln(1)
+
+    def paragraph(self, text, color=TEXT, style=""):
+        self.set_font(FONT, style, 11)
+        self.set_text_color(*color)
+        self.multi_cell(0, LINE_HEIGHT, latin1(text))
+
+    def label_value(self, label, value):
+        self.set_font(FONT, "B", 11)
+        self.set_text_color(*TEXT)
+        self.write(LINE_HEIGHT, latin1(f"{label} "))
+        self.set_font(FONT, "", 11)
+        self.write(LINE_HEIGHT, latin1(value))
+        self.ln(LINE_HEIGHT)
+
+    def bullet_list(self, items):
+        for item in items:
+            self.paragraph(f"- {item}")
+
+    def divider(self):
+        self.ln(4)
+        self.set_line_width(0.8)
+        self.set_draw_color(0, 0, 0)
+        self.line(10, self.get_y(), 10 + PAGE_WIDTH, self.get_y())
+        self.set_line_width(0.2)
+        self.ln(3)
+
+    def fitted_image(self, path):
+        try:
+            with Image.open(path) as img:
+                width_px, height_px = img.size
+            width = PAGE_WIDTH
+            height = width * height_px / width_px
+            if height > MAX_IMAGE_HEIGHT:
+                height = MAX_IMAGE_HEIGHT
+                width = height * width_px / height_px
+            if self.get_y() + height > self.page_break_trigger:
+                self.add_page()
+            self.image(path, x=10 + (PAGE_WIDTH - width) / 2, y=self.get_y(), w=width, h=height)
+            self.set_y(self.get_y() + height + 2)
+        except Exception as e:
+            self.paragraph(f"[Image could not be embedded: {e}]", color=RED)
+
+    def spans_text(self, text, spans, mode):
+        """Write text with errors marked: "superscript" adds S/G marks, "color" colours the errors"""
+        self.set_font(FONT, "", 11)
+        position = 0
+        for span in spans:
+            self.set_text_color(*TEXT)
+            self.write(LINE_HEIGHT, latin1(text[position:span["start"]]))
+            fragment = latin1(text[span["start"]:span["end"]])
+            spelling = "Spelling" in (span.get("category") or "")
+            if mode == "superscript":
+                self.write(LINE_HEIGHT, fragment)
+                self._superscript("S" if spelling else "G")
+            else:
+                self.set_text_color(*(RED if spelling else BLUE))
+                self.write(LINE_HEIGHT, fragment)
+            position = span["end"]
+        self.set_text_color(*TEXT)
+        self.write(LINE_HEIGHT, latin1(text[position:]))
+        self.ln(LINE_HEIGHT + 2)
+
+    def _superscript(self, mark):
+        self.set_font(FONT, "B", 7)
+        self.set_text_color(*RED)
+        x, y = self.get_x(), self.get_y()
+        if x + self.get_string_width(mark) < 10 + PAGE_WIDTH:
+            self.set_xy(x, y - 1.5)
+            self.write(LINE_HEIGHT, mark)
+            self.set_xy(self.get_x(), y)
+        else:
+            self.write(LINE_HEIGHT, mark)
+        self.set_font(FONT, "", 11)
+
+    def error_table(self, table):
+        if table.empty:
+            self.paragraph("No errors found.")
+            return
+        widths = (PAGE_WIDTH * 0.35, PAGE_WIDTH * 0.35, PAGE_WIDTH * 0.30)
+        headers = ("Incorrect Text (Red)", "Correct Text (Green)", "Error Category (Blue)")
+        self.set_fill_color(242, 242, 242)
+        self._table_row(headers, widths, [(0, 0, 0)] * 3, style="B", fill=True)
+        for entry in table:
+            self._table_row(entry.as_tuple(), widths, (RED, GREEN, BLUE), style="B")
+        self.ln(2)
+
+    def _table_row(self, values, widths, colors, style="", fill=False):
+        self.set_font(FONT, style, 10)
+        values = [latin1(value) for value in values]
+        line_height = 5
+        height = line_height * max(self._line_count(value, width - 2) for value, width in zip(values, widths)) + 2
+        if self.get_y() + height > self.page_break_trigger:
+            self.add_page()
+        x, y = self.get_x(), self.get_y()
+        for value, width, color in zip(values, widths, colors):
+            self.set_draw_color(221, 221, 221)
+            self.rect(x, y, width, height, "DF" if fill else "D")
+            self.set_text_color(*color)
+            self.set_xy(x + 1, y + 1)
+            self.multi_cell(width - 2, line_height, value)
+            x += width
+        self.set_xy(10, y + height)
+
+    def _line_count(self, text, width):
+        lines = 0
+        for paragraph in text.split("\n"):
+            lines += 1
+            line_width = 0
+            for word in paragraph.split(" "):
+                word_width = self.get_string_width(word + " ")
+                if line_width and line_width + word_width > width:
+                    lines += 1
+                    line_width = 0
+                line_width += word_width
+        return max(lines, 1)
+
+
+@cache
+def _report_class():
+    return type("ReportPDF", (ReportLayout, fpdf.FPDF), {})
+
+
+def new_report():
+    return _report_class()()
+
+
+def render_student_report(pdf_path, student_name, student_class, subject, results):
+    """Student report with the same sections as the HTML version, rendered in-process"""
+    pdf = new_report()
+    pdf.heading("Student Report", size=18, align="C")
+    pdf.label_value("Student Name:", student_name)
+    pdf.label_value("Class:", student_class)
+    pdf.label_value("Subject:", subject)
+
+    for i, result in enumerate(results):
+        extracted_text = result.get("extractedText") or "No text extracted"
+        error_table = ErrorTable.from_records(result.get("errorTable", []))
+        spans = result.get("errorSpans")
+        if not spans or not spans_match_text(extracted_text, spans):
+            spans = find_error_spans(extracted_text, error_table.rows())
+
+        pdf.divider()
+        pdf.heading(f"Image {i + 1}", size=15)
+        if result.get("image"):
+            pdf.heading("Uploaded Image:", size=12)
+            pdf.fitted_image(result["image"])
+        pdf.heading("Extracted Text (Errors Marked in Superscript):", size=12)
+        pdf.spans_text(extracted_text, spans, mode="superscript")
+        pdf.heading("Errors in the Text:", size=12)
+        pdf.error_table(error_table)
+        pdf.heading("Marked Text:", size=12)
+        pdf.spans_text(extracted_text, spans, mode="color")
+
+    pdf.output(pdf_path, "F")
+    return pdf_path
+
+
+def render_improvements_report(pdf_path, text, metrics, suggestions):
+    """Text improvement report, rendered in-process"""
+    pdf = new_report()
+    pdf.heading("Text Improvement Report", size=18)
+    pdf.heading("Original Text")
+    pdf.paragraph(text)
+    pdf.heading("Complexity Metrics")
+    pdf.bullet_list([
+        f"Word Count: {metrics.get('word_count', '-')}",
+        f"Sentence Count: {metrics.get('sentence_count', '-')}",
+        f"Avg. Words / Sentence: {metrics.get('avg_words_per_sentence', '-')}",
+        f"Avg. Word Length: {metrics.get('avg_word_length', '-')}",
+        f"Vocabulary Diversity: {metrics.get('vocabulary_diversity', '-')}%",
+    ])
+    pdf.heading("Strengths")
+    pdf.bullet_list(suggestions.get("strengths", []))
+    pdf.heading("Style Improvements")
+    pdf.bullet_list(suggestions.get("style_improvements", []))
+    pdf.heading("Vocabulary Enhancements")
+    for entry in suggestions.get("vocabulary_enhancements", []):
+        pdf.set_font(FONT, "B", 11)
+        pdf.set_text_color(*TEXT)
+        pdf.write(LINE_HEIGHT, latin1(f"- {entry.get('original', '')}"))
+        pdf.set_font(FONT, "", 11)
+        pdf.write(LINE_HEIGHT, latin1(f" -> {', '.join(entry.get('suggestions', []))}"))
+        pdf.ln(LINE_HEIGHT)
+    pdf.heading("Structure Suggestions")
+    pdf.bullet_list(suggestions.get("structure_suggestions", []))
+    pdf.output(pdf_path, "F")
+    return pdf_path
+
+
+def write_improvements_pdf(pdf_path, text, metrics, suggestions):
+    """Improvement report with the configured PDF_ENGINE"""
+    if PDF_ENGINE == "fpdf":
+        return render_improvements_report(pdf_path, text, metrics, suggestions)
+    pdfkit.from_string(improvements_report_html(text, metrics, suggestions), pdf_path, options=PDFKIT_OPTIONS)
+    return pdf_path
+
+
+def cached_report(directory, prefix, inputs, render):
+    """File name of the report for inputs, calling render(path) only if it does not exist yet.
+
+    The name is <prefix>_<sha256>.pdf over the JSON-normalised inputs, the engine
+    and the template version, so identical requests share one file (served as
+    immutable) and different ones never collide. The file is rendered under a
+    temporary name and moved into place, and a hit refreshes its mtime for the
+    retention policy.
+    """
+    normalized = json.dumps(inputs, sort_keys=True, ensure_ascii=False, separators=(",", ":"), default=str)
+    name = f"{prefix}_{content_key(normalized, PDF_ENGINE, TEMPLATE_VERSION)}.pdf"
+    path = os.path.join(directory, name)
+    if os.path.exists(path):
+        os.utime(path)
+        CACHE_LOOKUPS.inc(cache="report", result="hit")
+        return name
+    CACHE_LOOKUPS.inc(cache="report", result="miss")
+    tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        render(tmp_path)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return name
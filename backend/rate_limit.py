@@ -0,0 +1,75 @@
+import threading
+import time
+
+
+class TokenBucket:
+    """Thread-safe token bucket refilled continuously at `per_minute` units per minute.
+
+    acquire() blocks until the requested amount is available. A capacity of 0
+    disables the limit. Requests larger than the capacity wait for a full bucket
+    instead of blocking forever, and adjust() may drive the level negative when a
+    request turned out to cost more than estimated, delaying later callers.
+    """
+
+    def __init__(self, per_minute, burst=None):
+        self.capacity = float(burst if burst is not None else per_minute)
+        self.rate = per_minute / 60.0
+        self.level = self.capacity
+        self.updated = time.monotonic()
+        self.condition = threading.Condition()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self, amount=1):
+        """Block until amount units are available and take them; returns the seconds waited"""
+        if not self.enabled:
+            return 0.0
+        amount = min(amount, self.capacity)
+        started = time.monotonic()
+        with self.condition:
+            while True:
+                self._refill()
+                if self.level >= amount:
+                    self.level -= amount
+                    return time.monotonic() - started
+                self.condition.wait((amount - self.level) / self.rate)
+
+    def try_acquire(self, amount=1):
+        """Take amount units if available and return 0, else return the seconds until they will be.
+
+        Non-blocking counterpart of acquire() for event loops, which sleep with
+        asyncio.sleep() and try again.
+        """
+        if not self.enabled:
+            return 0.0
+        amount = min(amount, self.capacity)
+        with self.condition:
+            self._refill()
+            if self.level >= amount:
+                self.level -= amount
+                return 0.0
+            return (amount - self.level) / self.rate
+
+    def adjust(self, amount):
+        """Return (positive) or charge (negative) units once the real cost is known"""
+        if not self.enabled:
+            return
+        with self.condition:
+            self._refill()
+            self.level = min(self.capacity, self.level + amount)
+            self.condition.notify_all()
+
+    def drain(self, seconds):
+        """Empty the bucket so nobody is admitted for roughly `seconds` (e.g. after a 429)"""
+        if not self.enabled:
+            return
+        with self.condition:
+            self._refill()
+            self.level = min(self.level, -seconds * self.rate)
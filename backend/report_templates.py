@@ -0,0 +1,59 @@
+import os
+from functools import cache
+
+from jinja2 import Environment, FileSystemLoader, select_autoescape
+from markupsafe import Markup
+
+from error_table import ErrorTable
+from marking import find_error_spans, render_html, render_superscripts, spans_match_text
+
+TEMPLATE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "templates")
+# Bump whenever a template changes so cached reports are rendered again
+TEMPLATE_VERSION = "1"
+
+TEMPLATES = ("student_report.html", "improvements_report.html")
+
+
+@cache
+def _environment():
+    # Values are escaped unless wrapped in Markup
+    return Environment(
+        loader=FileSystemLoader(TEMPLATE_DIR),
+        autoescape=select_autoescape(["html"]),
+        trim_blocks=True,
+        lstrip_blocks=True,
+        auto_reload=False,
+    )
+
+
+@cache
+def get_template(name):
+    """Template compiled on first use, then kept for the life of the process"""
+    return _environment().get_template(name)
+
+
+def load_templates():
+    for name in TEMPLATES:
+        get_template(name)
+
+
+def student_report_html(student_name, student_class, subject, results):
+    """HTML of the student report; marked text is rendered from the error spans, never taken as HTML"""
+    pages = []
+    for result in results:
+        extracted_text = result.get("extractedText") or "No text extracted"
+        error_table = ErrorTable.from_records(result.get("errorTable", []))
+        spans = result.get("errorSpans")
+        if not spans or not spans_match_text(extracted_text, spans):
+            spans = find_error_spans(extracted_text, error_table.rows())
+        pages.append({
+            "image": result.get("image", ""),
+            "superscript_html": Markup(render_superscripts(extracted_text, spans)),
+            "marked_html": Markup(render_html(extracted_text, spans)),
+            "errors": list(error_table),
+        })
+    return get_template("student_report.html").render(student_name=student_name, student_class=student_class, subject=subject, pages=pages)
+
+
+def improvements_report_html(text, metrics, suggestions):
+    return get_template("improvements_report.html").render(text=text or "", metrics=metrics or {}, suggestions=suggestions or {})
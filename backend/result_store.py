@@ -0,0 +1,162 @@
+import importlib
+import json
+import os
+import time
+import uuid
+from abc import ABC, abstractmethod
+
+from database import get_connection, init_schema, transaction
+
+# Registry name of the backend ("sqlite") or a "package.module:ClassName" path
+RESULT_STORE = os.environ.get("RESULT_STORE", "sqlite")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS uploads (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    student_name TEXT,
+    student_class TEXT,
+    subject TEXT,
+    page_count INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_uploads_user ON uploads (user_id, created_at);
+CREATE INDEX IF NOT EXISTS idx_uploads_user_student ON uploads (user_id, student_name, created_at);
+CREATE INDEX IF NOT EXISTS idx_uploads_user_class ON uploads (user_id, student_class, created_at);
+CREATE INDEX IF NOT EXISTS idx_uploads_user_subject ON uploads (user_id, subject, created_at);
+
+CREATE TABLE IF NOT EXISTS upload_pages (
+    upload_id TEXT NOT NULL REFERENCES uploads (id),
+    page_index INTEGER NOT NULL,
+    image TEXT,
+    result TEXT NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (upload_id, page_index)
+);
+CREATE INDEX IF NOT EXISTS idx_upload_pages_image ON upload_pages (image);
+"""
+
+
+class ResultStore(ABC):
+    """Interface for grading-result storage, keyed by user id and upload id"""
+
+    @abstractmethod
+    def save_upload(self, user_id, results, student_name=None, student_class=None, subject=None, upload_id=None):
+        """Store the page results of one upload and return its upload id"""
+
+    @abstractmethod
+    def get_upload(self, user_id, upload_id):
+        """Upload with its page results, or None"""
+
+    @abstractmethod
+    def latest_upload(self, user_id):
+        """Most recent upload of the user with its page results, or None"""
+
+    @abstractmethod
+    def list_uploads(self, user_id, student_name=None, student_class=None, subject=None,
+                     limit=20, offset=0, include_results=False):
+        """(uploads, total) for one page of the user's history, newest first"""
+
+    @abstractmethod
+    def update_page(self, user_id, image, result, upload_id=None):
+        """Replace the stored result of a page (newest upload containing image); returns the upload id or None"""
+
+
+class SQLiteResultStore(ResultStore):
+    def __init__(self, db_path=None):
+        self.db_path = db_path
+        init_schema(SCHEMA, db_path)
+
+    def save_upload(self, user_id, results, student_name=None, student_class=None, subject=None, upload_id=None):
+        upload_id = upload_id or str(uuid.uuid4())
+        now = time.time()
+        with transaction(self.db_path) as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO uploads (id, user_id, student_name, student_class, subject, page_count,"
+                " created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (upload_id, user_id, student_name, student_class, subject, len(results), now),
+            )
+            conn.execute("DELETE FROM upload_pages WHERE upload_id = ?", (upload_id,))
+            conn.executemany(
+                "INSERT INTO upload_pages (upload_id, page_index, image, result, updated_at) VALUES (?, ?, ?, ?, ?)",
+                [(upload_id, i, result.get("image"), json.dumps(result), now) for i, result in enumerate(results)],
+            )
+        return upload_id
+
+    def _load(self, upload, include_results=True):
+        item = {
+            "uploadId": upload["id"],
+            "studentName": upload["student_name"],
+            "studentClass": upload["student_class"],
+            "subject": upload["subject"],
+            "pageCount": upload["page_count"],
+            "createdAt": upload["created_at"],
+        }
+        if include_results:
+            rows = get_connection(self.db_path).execute(
+                "SELECT result FROM upload_pages WHERE upload_id = ? ORDER BY page_index", (upload["id"],)
+            ).fetchall()
+            item["results"] = [json.loads(row["result"]) for row in rows]
+        return item
+
+    def get_upload(self, user_id, upload_id):
+        upload = get_connection(self.db_path).execute(
+            "SELECT * FROM uploads WHERE id = ? AND user_id = ?", (upload_id, user_id)
+        ).fetchone()
+        return self._load(upload) if upload else None
+
+    def latest_upload(self, user_id):
+        upload = get_connection(self.db_path).execute(
+            "SELECT * FROM uploads WHERE user_id = ? ORDER BY created_at DESC LIMIT 1", (user_id,)
+        ).fetchone()
+        return self._load(upload) if upload else None
+
+    def list_uploads(self, user_id, student_name=None, student_class=None, subject=None,
+                     limit=20, offset=0, include_results=False):
+        where, params = ["user_id = ?"], [user_id]
+        for column, value in (("student_name", student_name), ("student_class", student_class), ("subject", subject)):
+            if value:
+                where.append(f"{column} = ?")
+                params.append(value)
+        clause = " AND ".join(where)
+        conn = get_connection(self.db_path)
+        total = conn.execute(f"SELECT COUNT(*) FROM uploads WHERE {clause}", params).fetchone()[0]
+        rows = conn.execute(
+            f"SELECT * FROM uploads WHERE {clause} ORDER BY created_at DESC LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        return [self._load(row, include_results) for row in rows], total
+
+    def update_page(self, user_id, image, result, upload_id=None):
+        query = (
+            "SELECT p.upload_id, p.page_index FROM upload_pages p JOIN uploads u ON u.id = p.upload_id"
+            " WHERE u.user_id = ? AND p.image = ?"
+        )
+        params = [user_id, image]
+        if upload_id:
+            query += " AND u.id = ?"
+            params.append(upload_id)
+        with transaction(self.db_path) as conn:
+            row = conn.execute(query + " ORDER BY u.created_at DESC LIMIT 1", params).fetchone()
+            if row is None:
+                return None
+            stored = dict(result, image=image)
+            conn.execute(
+                "UPDATE upload_pages SET result = ?, updated_at = ? WHERE upload_id = ? AND page_index = ?",
+                (json.dumps(stored), time.time(), row["upload_id"], row["page_index"]),
+            )
+        return row["upload_id"]
+
+
+RESULT_STORE_BACKENDS = {
+    "sqlite": SQLiteResultStore,
+}
+
+
+def create_result_store(name=None):
+    """Instantiate the configured backend: a registry name or "module:ClassName" """
+    name = name or RESULT_STORE
+    if name in RESULT_STORE_BACKENDS:
+        return RESULT_STORE_BACKENDS[name]()
+    module_name, _, class_name = name.partition(":")
+    return getattr(importlib.import_module(module_name), class_name)()
@@ -0,0 +1,253 @@
+"""Offline spelling check: a SymSpell-style deletion index over word-frequency lists.
+
+Indexes are built once from a frequency list (one "word count" or "word" per line,
+most frequent first, optionally gzipped) and stored as flat arrays that are
+memory-mapped read-only, so every worker process shares the same pages. The
+English and German lists ship in dictionaries/ and the Docker image builds their
+indexes:
+
+    python spelling.py build dictionaries/english.txt.gz dictionaries/english.idx
+    python spelling.py check dictionaries/english.idx "I recieved you're leter"
+"""
+import argparse
+import gzip
+import hashlib
+import logging
+import mmap
+import os
+import re
+import struct
+import sys
+import threading
+
+from lazy_imports import lazy_module
+
+np = lazy_module("numpy")
+
+# "hybrid": spelling is checked locally and the LLM only looks for grammar errors;
+# "local": no LLM call at all; "off": the LLM checks both. Languages without an
+# index (or text whose language is uncertain) always use the LLM for both.
+SPELLING_MODE = os.environ.get("SPELLING_MODE", "hybrid").lower()
+SPELLING_DICT_DIR = os.environ.get(
+    "SPELLING_DICT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "dictionaries")
+)
+
+MAX_DISTANCE = 2
+# Deletes are generated from the first PREFIX_LENGTH characters only (as in SymSpell),
+# which bounds the index size; candidates are verified against the whole word
+PREFIX_LENGTH = 7
+MIN_WORD_LENGTH = 3
+# Smaller word lists flag too many correct words to be trusted
+MIN_DICTIONARY_WORDS = 10000
+# Words up to this length may only be one edit away from their correction
+SHORT_WORD_LENGTH = 4
+
+MAGIC = b"SMSPELL1"
+_HEADER = struct.Struct("<8sIIIIQ")
+
+logger = logging.getLogger(__name__)
+
+_WORD = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)*")
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _hash(term):
+    return int.from_bytes(hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest(), "little")
+
+
+def _deletes(term, max_distance):
+    """term and every string obtained by deleting up to max_distance characters"""
+    found, frontier = {term}, {term}
+    for _ in range(max_distance):
+        frontier = {candidate[:i] + candidate[i + 1:] for candidate in frontier for i in range(len(candidate))}
+        found |= frontier
+    return found
+
+
+def edit_distance(a, b, limit):
+    """Optimal string alignment distance (adjacent transpositions cost 1), or limit + 1 if above limit"""
+    if abs(len(a) - len(b)) > limit:
+        return limit + 1
+    previous2, previous = None, list(range(len(b) + 1))
+    for i in range(1, len(a) + 1):
+        current = [i] + [0] * len(b)
+        for j in range(1, len(b) + 1):
+            cost = 0 if a[i - 1] == b[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+            if i > 1 and j > 1 and a[i - 1] == b[j - 2] and a[i - 2] == b[j - 1]:
+                current[j] = min(current[j], previous2[j - 2] + 1)
+        if min(current) > limit:
+            return limit + 1
+        previous2, previous = previous, current
+    return previous[-1] if previous[-1] <= limit else limit + 1
+
+
+def build_index(words, path, max_distance=MAX_DISTANCE, prefix_length=PREFIX_LENGTH):
+    """Write an index for words (lower-cased, most frequent first) to path"""
+    words = list(dict.fromkeys(word.lower() for word in words if word))
+    hashes, ids = [], []
+    for word_id, word in enumerate(words):
+        for delete in _deletes(word[:prefix_length], max_distance):
+            hashes.append(_hash(delete))
+            ids.append(word_id)
+    hashes = np.array(hashes, dtype="<u8")
+    ids = np.array(ids, dtype="<u4")
+    order = np.lexsort((ids, hashes))
+
+    blob = b"".join(word.encode("utf-8") for word in words)
+    offsets = np.zeros(len(words) + 1, dtype="<u8")
+    np.cumsum([len(word.encode("utf-8")) for word in words], out=offsets[1:])
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as out:
+        out.write(_HEADER.pack(MAGIC, max_distance, prefix_length, len(words), len(hashes), len(blob)))
+        out.write(offsets.tobytes())
+        out.write(blob)
+        out.write(b"\0" * (-len(blob) % 8))
+        out.write(hashes[order].tobytes())
+        out.write(ids[order].tobytes())
+    os.replace(tmp_path, path)
+    return len(words), len(hashes)
+
+
+class SpellingIndex:
+    """Read-only view of an index file; lookups allocate nothing but the candidate list"""
+
+    def __init__(self, path):
+        with open(path, "rb") as fh:
+            self._mmap = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, self.max_distance, self.prefix_length, n_words, n_deletes, blob_size = _HEADER.unpack_from(self._mmap)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not a spelling index")
+        position = _HEADER.size
+        self._offsets = np.frombuffer(self._mmap, dtype="<u8", count=n_words + 1, offset=position)
+        position += self._offsets.nbytes
+        self._blob = position
+        position += blob_size + (-blob_size % 8)
+        self._hashes = np.frombuffer(self._mmap, dtype="<u8", count=n_deletes, offset=position)
+        position += self._hashes.nbytes
+        self._ids = np.frombuffer(self._mmap, dtype="<u4", count=n_deletes, offset=position)
+        self.size = n_words
+
+    def word(self, word_id):
+        start, end = self._offsets[word_id], self._offsets[word_id + 1]
+        return self._mmap[self._blob + int(start):self._blob + int(end)].decode("utf-8")
+
+    def lookup(self, term):
+        """(known, suggestion): whether term is a dictionary word, else its closest frequent word or None"""
+        queries = np.array([_hash(delete) for delete in _deletes(term[:self.prefix_length], self.max_distance)],
+                           dtype="<u8")
+        lows = np.searchsorted(self._hashes, queries, side="left")
+        highs = np.searchsorted(self._hashes, queries, side="right")
+        # Word ids are frequency ranks, so the first candidate at the best distance is the most common
+        candidates = sorted({int(word_id) for low, high in zip(lows, highs) for word_id in self._ids[low:high]})
+        best, best_distance = None, (self.max_distance if len(term) > SHORT_WORD_LENGTH else 1) + 1
+        for word_id in candidates:
+            word = self.word(word_id)
+            if word == term:
+                return True, None
+            if abs(len(word) - len(term)) >= best_distance:
+                continue
+            distance = edit_distance(term, word, best_distance - 1)
+            if distance < best_distance:
+                best, best_distance = word, distance
+        return False, best
+
+
+def load_index(language):
+    """The memory-mapped index for language ('english', 'german'), or None if none is installed"""
+    with _indexes_lock:
+        if language not in _indexes:
+            path = os.path.join(SPELLING_DICT_DIR, f"{language}.idx")
+            try:
+                index = SpellingIndex(path)
+                if index.size < MIN_DICTIONARY_WORDS:
+                    raise ValueError(f"only {index.size} words")
+                _indexes[language] = index
+            except (OSError, ValueError) as e:
+                logger.info("No spelling index for %s (%s); the LLM checks spelling", language, e)
+                _indexes[language] = None
+        return _indexes[language]
+
+
+def _match_case(suggestion, token):
+    if token.isupper():
+        return suggestion.upper()
+    if token[0].isupper():
+        return suggestion[0].upper() + suggestion[1:]
+    return suggestion
+
+
+def find_misspellings(text, language):
+    """Spelling errors as dicts (incorrect, correct, category, start, end), or None without an index.
+
+    Words that are not in the dictionary are reported only when a word within
+    MAX_DISTANCE edits exists. Short and all-caps words are skipped, and so are
+    capitalised English words inside a sentence, which are usually names.
+    """
+    index = load_index(language)
+    if index is None:
+        return None
+    errors = []
+    previous_end = None
+    for match in _WORD.finditer(text):
+        token = match.group(0)
+        # A sentence starts at the first word and after . ! ? : or an opening quote
+        starts_sentence = previous_end is None or any(c in ".!?:\"“„" for c in text[previous_end:match.start()])
+        previous_end = match.end()
+        if len(token) < MIN_WORD_LENGTH or token.isupper():
+            continue
+        if language == "english" and token[0].isupper() and not starts_sentence:
+            continue
+        known, suggestion = index.lookup(token.lower().replace("’", "'"))
+        if known or suggestion is None:
+            continue
+        errors.append({
+            "incorrect": token,
+            "correct": _match_case(suggestion, token),
+            "category": "Spelling",
+            "start": match.start(),
+            "end": match.end(),
+        })
+    return errors
+
+
+def _read_word_list(path):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as fh:
+        for line in fh:
+            fields = line.split()
+            if fields and not fields[0].startswith("#"):
+                yield fields[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="build an index from a word-frequency list")
+    build.add_argument("word_list")
+    build.add_argument("index")
+    build.add_argument("--max-words", type=int, default=0, help="keep only the most frequent words")
+    check = commands.add_parser("check", help="print the misspellings found in a text")
+    check.add_argument("index")
+    check.add_argument("text")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        words = list(_read_word_list(args.word_list))
+        if args.max_words:
+            words = words[:args.max_words]
+        n_words, n_deletes = build_index(words, args.index)
+        print(f"{args.index}: {n_words} words, {n_deletes} deletes, {os.path.getsize(args.index) / 1e6:.1f} MB")
+    else:
+        index = SpellingIndex(args.index)
+        for match in _WORD.finditer(args.text):
+            known, suggestion = index.lookup(match.group(0).lower())
+            if not known:
+                print(f"{match.group(0)} -> {suggestion}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
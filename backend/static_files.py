@@ -0,0 +1,59 @@
+import mimetypes
+import os
+import re
+
+from flask import Response, jsonify, request, send_file
+from werkzeug.security import safe_join
+
+from thumbnails import image_hash
+
+# "" streams files from Flask; "x-accel" (nginx, Caddy handle_response) or "x-sendfile"
+# (Apache, lighttpd) return only headers and let the front proxy send the bytes
+STATIC_OFFLOAD = os.environ.get("STATIC_OFFLOAD", "").lower()
+# Internal location the proxy maps to the storage directories for X-Accel-Redirect
+STATIC_OFFLOAD_PREFIX = os.environ.get("STATIC_OFFLOAD_PREFIX", "/_protected").rstrip("/")
+# Revalidation interval for files whose name is not content-addressed
+STATIC_MAX_AGE = int(os.environ.get("STATIC_MAX_AGE", "0"))
+
+IMMUTABLE_MAX_AGE = 365 * 24 * 3600
+_DIGEST = re.compile(r"[0-9a-f]{64}")
+
+
+def send_stored_file(root, area, name, as_attachment=False):
+    """Serve root/name with a content-hash ETag, conditional GET and Range support.
+
+    Names containing a SHA-256 digest (content-addressed uploads, renditions) never
+    change, so they are cached as immutable for a year with the digest as a strong
+    ETag; other files get an ETag from their memoised content hash. area is the
+    directory's name under STATIC_OFFLOAD_PREFIX when the proxy serves the bytes.
+    """
+    path = safe_join(root, name)
+    if path is None or not os.path.isfile(path):
+        return jsonify({'error': 'File not found'}), 404
+
+    stem = os.path.splitext(os.path.basename(name))[0]
+    immutable = _DIGEST.search(stem) is not None
+    etag = stem if immutable else image_hash(path)
+    max_age = IMMUTABLE_MAX_AGE if immutable else STATIC_MAX_AGE
+
+    if STATIC_OFFLOAD in ("x-accel", "x-sendfile"):
+        response = Response(mimetype=mimetypes.guess_type(path)[0] or "application/octet-stream")
+        response.set_etag(etag)
+        if request.if_none_match.contains(etag):
+            response.status_code = 304
+        elif STATIC_OFFLOAD == "x-accel":
+            response.headers["X-Accel-Redirect"] = f"{STATIC_OFFLOAD_PREFIX}/{area}/{name}"
+        else:
+            response.headers["X-Sendfile"] = os.path.abspath(path)
+        if as_attachment:
+            response.headers["Content-Disposition"] = f'attachment; filename="{os.path.basename(name)}"'
+    else:
+        response = send_file(path, etag=etag, conditional=True, as_attachment=as_attachment, max_age=max_age)
+
+    response.cache_control.public = True
+    response.cache_control.max_age = max_age
+    if immutable:
+        response.cache_control.immutable = True
+    elif not max_age:
+        response.cache_control.no_cache = True
+    return response
@@ -0,0 +1,279 @@
+import hashlib
+import logging
+import mimetypes
+import os
+import tempfile
+import threading
+import time
+
+from database import get_connection, init_schema, transaction
+from image_preprocessing import guess_mime_type
+from lazy_imports import lazy_module
+
+Image = lazy_module("PIL.Image")
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+UPLOAD_FOLDER = os.environ.get("UPLOAD_FOLDER", os.path.join(BASE_DIR, "uploads"))
+
+# Retention policies (0 keeps files forever). Uploads count from their last use
+# (upload, retry or report); generated PDFs and Word documents from creation.
+UPLOAD_RETENTION_DAYS = float(os.environ.get("UPLOAD_RETENTION_DAYS", "0"))
+PDF_RETENTION_DAYS = float(os.environ.get("PDF_RETENTION_DAYS", "7"))
+DOCUMENT_RETENTION_DAYS = float(os.environ.get("DOCUMENT_RETENTION_DAYS", "7"))
+STORAGE_GC_INTERVAL_MINUTES = float(os.environ.get("STORAGE_GC_INTERVAL_MINUTES", "60"))
+
+DAY = 24 * 3600
+# Temporary files older than this were left behind by a crashed save
+STALE_TEMP_SECONDS = 3600
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    digest TEXT PRIMARY KEY,
+    path TEXT NOT NULL,
+    mime_type TEXT,
+    size INTEGER NOT NULL,
+    width INTEGER,
+    height INTEGER,
+    created_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_blobs_last_used ON blobs (last_used_at);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_blobs_path ON blobs (path);
+
+CREATE TABLE IF NOT EXISTS blob_owners (
+    digest TEXT NOT NULL REFERENCES blobs (digest),
+    owner_id TEXT NOT NULL,
+    original_name TEXT,
+    first_seen REAL NOT NULL,
+    PRIMARY KEY (digest, owner_id)
+);
+CREATE INDEX IF NOT EXISTS idx_blob_owners_owner ON blob_owners (owner_id, first_seen);
+"""
+
+
+def blob_name(digest, extension):
+    """Sharded relative path: ab/cd/abcd...<ext>, two levels of 256 directories"""
+    return f"{digest[:2]}/{digest[2:4]}/{digest}{extension}"
+
+
+def _extension(mime_type, filename):
+    if mime_type == "image/jpeg":
+        return ".jpg"
+    extension = mimetypes.guess_extension(mime_type or "") or os.path.splitext(filename or "")[1]
+    return extension.lower()
+
+
+class BlobStore:
+    """Content-addressed file storage with a SQLite metadata index.
+
+    Identical uploads are stored once under a sharded content-hash name that is
+    also the public image name (a relative path under root), so existing code that
+    joins it onto the upload folder keeps working. Owners are recorded per blob.
+    """
+
+    def __init__(self, root=UPLOAD_FOLDER, db_path=None):
+        self.root = root
+        self.db_path = db_path
+        os.makedirs(root, exist_ok=True)
+        init_schema(SCHEMA, db_path)
+
+    def path(self, name):
+        return os.path.join(self.root, name)
+
+    def save(self, stream, filename, owner_id=None):
+        """Store an uploaded file (a readable stream) and return its image name.
+
+        The content is hashed while it is written to a temporary file, which is
+        then moved into place unless a blob with the same digest already exists.
+        """
+        digest = hashlib.sha256()
+        fd, tmp_path = tempfile.mkstemp(prefix=".upload-", dir=self.root)
+        size = 0
+        head = b""
+        try:
+            with os.fdopen(fd, "wb") as out:
+                while True:
+                    chunk = stream.read(1024 * 1024)
+                    if not chunk:
+                        break
+                    if len(head) < 64:
+                        head += chunk[:64]
+                    digest.update(chunk)
+                    out.write(chunk)
+                    size += len(chunk)
+            digest = digest.hexdigest()
+            mime_type = guess_mime_type(filename, head)
+            name = blob_name(digest, _extension(mime_type, filename))
+            final_path = self.path(name)
+            try:
+                with Image.open(tmp_path) as img:
+                    width, height = img.size
+            except Exception:
+                width = height = None
+
+            now = time.time()
+            # Placing the file and indexing it share one write transaction, so the
+            # collector cannot delete a blob between the existence check and the upsert
+            with transaction(self.db_path) as conn:
+                existing = conn.execute("SELECT path FROM blobs WHERE digest = ?", (digest,)).fetchone()
+                if existing is not None:
+                    name, final_path = existing["path"], self.path(existing["path"])
+                if os.path.exists(final_path):
+                    os.remove(tmp_path)
+                else:
+                    os.makedirs(os.path.dirname(final_path), exist_ok=True)
+                    os.replace(tmp_path, final_path)
+                conn.execute(
+                    "INSERT INTO blobs (digest, path, mime_type, size, width, height, created_at, last_used_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT (digest) DO UPDATE SET last_used_at = excluded.last_used_at",
+                    (digest, name, mime_type, size, width, height, now, now),
+                )
+                if owner_id is not None:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO blob_owners (digest, owner_id, original_name, first_seen)"
+                        " VALUES (?, ?, ?, ?)",
+                        (digest, str(owner_id), filename, now),
+                    )
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return name
+
+    def info(self, name):
+        """Metadata of a stored blob by image name, or None (e.g. legacy flat uploads)"""
+        row = get_connection(self.db_path).execute(
+            "SELECT digest, path, mime_type, size, width, height, created_at, last_used_at FROM blobs WHERE path = ?",
+            (name,),
+        ).fetchone()
+        if row is None:
+            return None
+        info = dict(row)
+        info["owners"] = [
+            owner["owner_id"] for owner in get_connection(self.db_path).execute(
+                "SELECT owner_id FROM blob_owners WHERE digest = ? ORDER BY first_seen", (row["digest"],)
+            )
+        ]
+        return info
+
+    def touch(self, name):
+        """Mark a blob as used so the retention policy keeps it"""
+        get_connection(self.db_path).execute(
+            "UPDATE blobs SET last_used_at = ? WHERE path = ?", (time.time(), name)
+        )
+
+    def collect(self, max_age, protected=()):
+        """Delete blobs unused for max_age seconds (and legacy flat uploads by mtime); returns the count"""
+        cutoff = time.time() - max_age
+        protected = set(protected)
+        removed = 0
+        rows = get_connection(self.db_path).execute(
+            "SELECT digest, path FROM blobs WHERE last_used_at < ?", (cutoff,)
+        ).fetchall()
+        for row in rows:
+            if row["path"] in protected:
+                continue
+            with transaction(self.db_path) as conn:
+                # Re-check inside the transaction: the blob may have been re-uploaded meanwhile
+                deleted = conn.execute(
+                    "DELETE FROM blobs WHERE digest = ? AND last_used_at < ?", (row["digest"], cutoff)
+                ).rowcount
+                if deleted:
+                    conn.execute("DELETE FROM blob_owners WHERE digest = ?", (row["digest"],))
+                    _remove(self.path(row["path"]))
+                    removed += 1
+
+        # Uploads from before content addressing live directly in the root
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if (entry.is_file() and not entry.name.startswith(".") and entry.name not in protected
+                        and entry.stat().st_mtime < cutoff):
+                    _remove_file(entry.path)
+                    removed += 1
+        return removed
+
+    def remove_stale_temp_files(self):
+        cutoff = time.time() - STALE_TEMP_SECONDS
+        with os.scandir(self.root) as entries:
+            for entry in entries:
+                if entry.name.startswith(".upload-") and entry.stat().st_mtime < cutoff:
+                    _remove_file(entry.path)
+
+
+def _remove(path):
+    _remove_file(path)
+    # Drop the shard directories once they are empty
+    for directory in (os.path.dirname(path), os.path.dirname(os.path.dirname(path))):
+        try:
+            os.rmdir(directory)
+        except OSError:
+            break
+
+
+def expire_files(directory, max_age):
+    """Delete regular files in directory older than max_age seconds; returns the count"""
+    if not os.path.isdir(directory):
+        return 0
+    cutoff = time.time() - max_age
+    removed = 0
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if entry.is_file() and entry.stat().st_mtime < cutoff:
+                _remove_file(entry.path)
+                removed += 1
+    return removed
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+class RetentionCollector:
+    """Background thread applying the retention policies every STORAGE_GC_INTERVAL_MINUTES.
+
+    protected() returns image names that must survive (e.g. pages of queued jobs).
+    """
+
+    def __init__(self, blob_store, pdf_directory, document_directory, protected=None):
+        self.blob_store = blob_store
+        self.pdf_directory = pdf_directory
+        self.document_directory = document_directory
+        self.protected = protected or (lambda: ())
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if STORAGE_GC_INTERVAL_MINUTES <= 0 or self._thread is not None:
+            return
+        self._thread = threading.Thread(target=self._loop, name="storage-gc", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def run_once(self):
+        removed = {"uploads": 0, "pdfs": 0, "documents": 0}
+        self.blob_store.remove_stale_temp_files()
+        if UPLOAD_RETENTION_DAYS > 0:
+            removed["uploads"] = self.blob_store.collect(UPLOAD_RETENTION_DAYS * DAY, self.protected())
+        if PDF_RETENTION_DAYS > 0:
+            removed["pdfs"] = expire_files(self.pdf_directory, PDF_RETENTION_DAYS * DAY)
+        if DOCUMENT_RETENTION_DAYS > 0:
+            removed["documents"] = expire_files(self.document_directory, DOCUMENT_RETENTION_DAYS * DAY)
+        if any(removed.values()):
+            logger.info("Storage GC removed %(uploads)d uploads, %(pdfs)d PDFs, %(documents)d documents", removed)
+        return removed
+
+    def _loop(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception:
+                logger.exception("Storage GC failed")
+            self._stop.wait(STORAGE_GC_INTERVAL_MINUTES * 60)
@@ -1,10 +1,16 @@
-import openai
+import asyncio
+import logging
 import re
 from collections import Counter
 from dotenv import load_dotenv
 
+from language_detection import detect_language as detect_language_cached
+from llm_client import LLM_FAST_MODEL, achat_completion, chat_completion
+
 load_dotenv()
 
+logger = logging.getLogger(__name__)
+
 
 def detect_language_with_openai(text):
     """Detect language using OpenAI"""
@@ -17,8 +23,8 @@ Respond with ONLY ONE WORD:
 
 Consider grammar patterns, vocabulary, and sentence structure."""
 
-        response = openai.chat.completions.create(
-            model="gpt-3.5-turbo",
+        response = chat_completion(
+            model=LLM_FAST_MODEL,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": f"Detect the language: {text[:300]}"}
@@ -31,7 +37,7 @@ Consider grammar patterns, vocabulary, and sentence structure."""
         return detected_language if detected_language in ['german', 'english'] else 'english'
         
     except Exception as e:
-        print(f"Language detection failed: {str(e)}")
+        logger.warning("Language detection failed: %s", e)
         # Simple fallback
         german_words = ['der', 'die', 'das', 'und', 'ist', 'mit', 'zu', 'auf', 'für', 'von']
         english_words = ['the', 'and', 'is', 'to', 'of', 'a', 'in', 'that', 'for', 'with']
@@ -43,11 +49,20 @@ Consider grammar patterns, vocabulary, and sentence structure."""
         return 'german' if german_count > english_count else 'english'
 
 
+def detect_language(text):
+    """Offline n-gram detection, asking OpenAI only when it is not confident; memoised per text"""
+    return detect_language_cached(text, fallback=detect_language_with_openai)
+
+
 def analyze_text_complexity(text):
     """Calculate various text complexity metrics using basic string operations"""
     # Detect language first
-    language = detect_language_with_openai(text)
-    
+    language = detect_language(text)
+    return {"language": language, **text_metrics(text)}
+
+
+def text_metrics(text):
+    """Word, sentence and vocabulary metrics of analyze_text_complexity, without the language detection"""
     # Simple sentence tokenization by splitting on periods, exclamation points, and question marks
     sentences = [s.strip() for s in re.split(r"[.!?]+", text) if s.strip()]
 
@@ -74,7 +89,6 @@ def analyze_text_complexity(text):
     vocabulary_diversity = len(set(word.lower() for word in words)) / max(word_count, 1)
 
     return {
-        "language": language,
         "word_count": word_count,
         "sentence_count": sentence_count,
         "avg_words_per_sentence": round(avg_words_per_sentence, 1),
@@ -84,11 +98,8 @@ def analyze_text_complexity(text):
     }
 
 
-def generate_improvement_suggestions(text):
-    """Generate text improvement suggestions using GPT in detected language"""
-    # Detect language
-    language = detect_language_with_openai(text)
-    
+def _suggestion_messages(text, language):
+    """System and user messages asking for improvement suggestions in the text's language"""
     if language == 'german':
         system_prompt = """Du bist ein Experte für Schreibberatung. Analysiere den Text und gib folgende Verbesserungsvorschläge auf Deutsch:
 
@@ -136,38 +147,60 @@ Format your response as a structured JSON with these sections:
         
         user_message = f"Analyze this text: {text}"
 
-    # Call GPT-4o with the text
+    return [
+        {"role": "system", "content": system_prompt},
+        {"role": "user", "content": user_message},
+    ]
+
+
+def _suggestion_fallback(language):
+    """Error messages in the text's language, shown when the LLM call fails"""
+    if language == 'german':
+        return {
+            "style_improvements": ["Fehler beim Generieren der Stilvorschläge"],
+            "vocabulary_enhancements": [],
+            "structure_suggestions": ["Fehler beim Generieren der Strukturvorschläge"],
+            "strengths": ["Textanalyse nicht verfügbar"],
+        }
+    else:
+        return {
+            "style_improvements": ["Error generating style suggestions"],
+            "vocabulary_enhancements": [],
+            "structure_suggestions": ["Error generating structure suggestions"],
+            "strengths": ["Text analysis unavailable"],
+        }
+
+
+def generate_improvement_suggestions(text):
+    """Generate text improvement suggestions using GPT in detected language"""
+    # Detect language (memoised, so this reuses the result from analyze_text_complexity)
+    language = detect_language(text)
+
+    # Call the main model (LLM_MODEL) with the text
     try:
-        response = openai.chat.completions.create(
-            model="gpt-4o",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message},
-            ],
+        response = chat_completion(
+            messages=_suggestion_messages(text, language),
             response_format={"type": "json_object"},
         )
+        return response.choices[0].message.content
+    except Exception as e:
+        logger.warning("Error generating suggestions: %s", e)
+        return _suggestion_fallback(language)
+
 
-        # Parse the JSON response
-        suggestions = response.choices[0].message.content
-        return suggestions
+async def agenerate_improvement_suggestions(text, language=None):
+    """generate_improvement_suggestions for async views: the LLM call is awaited, not blocking a thread"""
+    if language is None:
+        language = await asyncio.to_thread(detect_language, text)
+    try:
+        response = await achat_completion(
+            messages=_suggestion_messages(text, language),
+            response_format={"type": "json_object"},
+        )
+        return response.choices[0].message.content
     except Exception as e:
-        print(f"Error generating suggestions: {str(e)}")
-        
-        # Return error messages in appropriate language
-        if language == 'german':
-            return {
-                "style_improvements": ["Fehler beim Generieren der Stilvorschläge"],
-                "vocabulary_enhancements": [],
-                "structure_suggestions": ["Fehler beim Generieren der Strukturvorschläge"],
-                "strengths": ["Textanalyse nicht verfügbar"],
-            }
-        else:
-            return {
-                "style_improvements": ["Error generating style suggestions"],
-                "vocabulary_enhancements": [],
-                "structure_suggestions": ["Error generating structure suggestions"],
-                "strengths": ["Text analysis unavailable"],
-            }
+        logger.warning("Error generating suggestions: %s", e)
+        return _suggestion_fallback(language)
 
 
 def get_text_improvements(text):
@@ -175,7 +208,7 @@ def get_text_improvements(text):
     # Get basic text complexity metrics (includes language detection)
     complexity_metrics = analyze_text_complexity(text)
 
-    # Get GPT-generated improvement suggestions (detects language again for consistency)
+    # Get GPT-generated improvement suggestions (language detection is memoised per text)
     suggestions_json = generate_improvement_suggestions(text)
 
     # Combine all results
@@ -0,0 +1,88 @@
+import logging
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from disk_cache import CACHE_ROOT, file_sha256
+from lazy_imports import lazy_module
+from observability import CACHE_LOOKUPS
+
+Image = lazy_module("PIL.Image")
+ImageOps = lazy_module("PIL.ImageOps")
+
+logger = logging.getLogger(__name__)
+
+# Long edge and JPEG quality of the image embedded in PDF reports
+REPORT_IMAGE_MAX_EDGE = int(os.environ.get("REPORT_IMAGE_MAX_EDGE", "1200"))
+REPORT_IMAGE_QUALITY = int(os.environ.get("REPORT_IMAGE_QUALITY", "75"))
+RENDITION_DIR = os.path.join(CACHE_ROOT, "renditions")
+# Long edges offered by /thumbnails; requests are rounded up to one of these so the cache stays bounded
+THUMBNAIL_SIZES = tuple(sorted(int(size) for size in os.environ.get("THUMBNAIL_SIZES", "200,400,800,1200").split(",")))
+
+_prewarm_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rendition")
+# Striped locks so two requests never build the same rendition at once
+_locks = [threading.Lock() for _ in range(32)]
+
+
+@lru_cache(maxsize=4096)
+def _hash_for(path, size, mtime_ns):
+    return file_sha256(path)
+
+
+def image_hash(image_path):
+    """Content hash of an image, memoised on (path, size, mtime) so repeat lookups skip reading it"""
+    stat = os.stat(image_path)
+    return _hash_for(os.path.abspath(image_path), stat.st_size, stat.st_mtime_ns)
+
+
+def rendition_path(digest, max_edge):
+    return os.path.join(RENDITION_DIR, digest[:2], f"{digest}_{max_edge}.jpg")
+
+
+def get_rendition(image_path, max_edge=REPORT_IMAGE_MAX_EDGE, quality=REPORT_IMAGE_QUALITY):
+    """Path of a downscaled JPEG of the image, created once per content hash and size.
+
+    Raises if the image cannot be decoded, so callers can use it to validate uploads.
+    """
+    digest = image_hash(image_path)
+    path = rendition_path(digest, max_edge)
+    if os.path.exists(path):
+        CACHE_LOOKUPS.inc(cache="renditions", result="hit")
+        return path
+    CACHE_LOOKUPS.inc(cache="renditions", result="miss")
+    with _lock_for(path):
+        if os.path.exists(path):
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with Image.open(image_path) as img:
+            img = ImageOps.exif_transpose(img)
+            if img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            img.thumbnail((max_edge, max_edge), Image.LANCZOS)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            img.save(tmp_path, "JPEG", quality=quality, optimize=True)
+        os.replace(tmp_path, path)
+    return path
+
+
+def thumbnail_size(requested):
+    """Smallest offered size that is at least the requested long edge"""
+    for size in THUMBNAIL_SIZES:
+        if size >= requested:
+            return size
+    return THUMBNAIL_SIZES[-1]
+
+
+def prewarm_rendition(image_path):
+    """Create the report rendition in the background, e.g. right after an upload"""
+    def build():
+        try:
+            get_rendition(image_path)
+        except Exception as e:
+            logger.warning("Could not create report rendition for %s: %s", os.path.basename(image_path), e)
+    _prewarm_executor.submit(build)
+
+
+def _lock_for(path):
+    return _locks[hash(path) % len(_locks)]